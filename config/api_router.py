@@ -9,6 +9,12 @@ from dbt.analytics.views import (
     CrontabScheduleViewSet,
     DBTCurrentVersionView,
     RunDBTTask,
+    NodeRunResultViewSet,
+    DBTLogsViewSet,
+    RunStatusView,
+    LineageView,
+    RunViewSet,
+    RunEventsView,
 )
 from django.urls import path
 from django.conf.urls.static import static
@@ -28,6 +34,9 @@ router.register(r"interval", InterValViewSet, basename="interval")
 router.register(r"crontab", CrontabScheduleViewSet, basename="crontab")
 router.register(r"periodic-task", AddPeriodicTask, basename="periodic-task")
 router.register(r"profile_yaml", PostYMALDetailsView, basename="profile_yaml")
+router.register(r"dbt-logs", DBTLogsViewSet, basename="dbt-logs")
+router.register(r"runs", RunViewSet, basename="runs")
+router.register(r"node-run-results", NodeRunResultViewSet, basename="node-run-results")
 
 urlpatterns = [
     path(
@@ -36,6 +45,9 @@ urlpatterns = [
         name="dbt-current-version",
     ),
     path("run-dbt-task", RunDBTTask.as_view(), name="run-dbt-task"),
+    path("runs/<str:run_id>/status", RunStatusView.as_view(), name="run-status"),
+    path("runs/<str:run_id>/events", RunEventsView.as_view(), name="run-events"),
+    path("lineage/<str:unique_id>/<str:direction>", LineageView.as_view(), name="lineage"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 urlpatterns += router.urls
@@ -1,7 +1,9 @@
 import json
 import os
+from django.conf import settings
 from django.core.management import call_command
-from celery import Celery, shared_task
+from django.db import transaction
+from celery import Celery
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -18,13 +20,80 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 
-@shared_task
 @app.task(
-    bind=True, name="dbt_runner_task")
+    bind=True, name="dbt_runner_task", max_retries=None)
 def dbt_runner_task(self, *args, **kwargs):
+    from redis import RedisError
+    from dbt.analytics.concurrency import run_priority, run_slots
+    from dbt.analytics.runs import TrackedRun, start_run
+    from dbt.analytics.triggers import claim_run, release_trigger
+    from dbt.utils.run_status import RUN_STATUS_QUEUED
+    from dbt.utils.slots import queue_score
+
     option = "--dbt_command={}".format(self.request.args[0])
-    option_two = "--pk={}".format(self.request.kwargs)  # pk is git repo object id
-    call_command("dbt_command", option, option_two)
+    # pk is git repo object id, run_id lets the run report its status
+    option_two = "--pk={}".format(dict(self.request.kwargs, run_id=self.request.id))
+    # a second trigger of a run that is already queued or going on joins it
+    trigger_key, owner = claim_run(self.request.id, self.request.args, kwargs)
+    if owner != self.request.id:
+        print(f"The same run is already queued as {owner}")
+        return owner
+    # the run shows up as soon as a worker has it, long before it has a log
+    start_run(
+        self.request.id,
+        kwargs.get("task_id"),
+        self.request.args[0],
+        kwargs.get("parent_log_id"),
+    )
+    # wait for a slot of the task's profile and repo without holding the worker
+    slots = run_slots(kwargs.get("task_id"))
+    # the place in the queue of the first attempt, kept by every retry
+    slot_score = kwargs.get("slot_score") or queue_score(run_priority(kwargs.get("task_id")))
+    try:
+        if slots is not None and not slots.acquire(self.request.id, slot_score):
+            TrackedRun(self.request.id).set(RUN_STATUS_QUEUED, detail="waiting for a run slot")
+            raise self.retry(
+                kwargs=dict(kwargs, slot_score=slot_score),
+                countdown=getattr(settings, "DBT_SLOT_RETRY_SECONDS"),
+            )
+    except RedisError as err:
+        print(f"Run slots unavailable, running without limits: {err}")
+        slots = None
+    try:
+        if slots is None:
+            call_command("dbt_command", option, option_two)
+        else:
+            with slots.held(self.request.id):
+                call_command("dbt_command", option, option_two)
+    finally:
+        if trigger_key is not None:
+            release_trigger(trigger_key, self.request.id)
+    return self.request.id
+
+
+@app.task(bind=True, name="merge_dbt_shards_task")
+def merge_dbt_shards_task(self, dbt_log_id):
+    call_command("merge_dbt_shards", "--pk={}".format(dbt_log_id))
+
+
+@app.task(bind=True, name="trigger_on_new_data_task")
+def trigger_on_new_data_task(self, *args, **kwargs):
+    call_command("trigger_on_new_data")
+
+
+@app.task(bind=True, name="compact_dbt_logs_task")
+def compact_dbt_logs_task(self, *args, **kwargs):
+    call_command("compact_dbt_logs")
+
+
+@app.task(bind=True, name="clone_git_repo_task")
+def clone_git_repo_task(self, repo_id):
+    call_command("sync_git_repo", "--pk={}".format(repo_id))
+
+
+def schedule_git_repo_clone(repo):
+    """Clone ``repo`` in the background once the current transaction is committed."""
+    transaction.on_commit(lambda: clone_git_repo_task.delay(repo.id))
 
 
 @app.task(bind=True)
@@ -2,6 +2,7 @@
 Base settings to build other settings files upon.
 """
 import os
+import sys
 from pathlib import Path
 
 import environ
@@ -266,6 +267,21 @@ CELERY_TASK_TIME_LIMIT = 43200
 CELERY_TASK_SOFT_TIME_LIMIT = 43200
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# how often trigger_on_new_data looks for new source data of run_on_new_data tasks
+DBT_NEW_DATA_CHECK_SECONDS = env.int("DBT_NEW_DATA_CHECK_SECONDS", default=60)
+# how often compact_dbt_logs moves artifacts and output of old runs to the archive
+DBT_RETENTION_COMPACT_SECONDS = env.int("DBT_RETENTION_COMPACT_SECONDS", default=24 * 60 * 60)
+# entries are copied into django_celery_beat's periodic tasks when beat starts
+CELERY_BEAT_SCHEDULE = {
+    "trigger-on-new-data": {
+        "task": "trigger_on_new_data_task",
+        "schedule": DBT_NEW_DATA_CHECK_SECONDS,
+    },
+    "compact-dbt-logs": {
+        "task": "compact_dbt_logs_task",
+        "schedule": DBT_RETENTION_COMPACT_SECONDS,
+    },
+}
 
 # django-rest-framework
 # -------------------------------------------------------------------------------
@@ -302,3 +318,65 @@ SPECTACULAR_SETTINGS = {
 EXTERNAL_REPO_PREFIX = 'external'
 THIS_PROJECT_PATH = '/root/.dbt'
 SSH_KEY_PREFIX = "git-django_"
+# bare mirrors of the git repos, the working trees are checked out from them
+GIT_MIRRORS_PATH = os.path.join(THIS_PROJECT_PATH, "mirrors")
+# every run checks its commit out into its own directory under here
+GIT_RUNS_PATH = os.path.join(THIS_PROJECT_PATH, "runs")
+# fetch only this many commits (0 for full history) and/or use a partial clone filter such as "blob:none"
+GIT_CLONE_DEPTH = env.int("GIT_CLONE_DEPTH", default=0)
+GIT_CLONE_FILTER = env("GIT_CLONE_FILTER", default="")
+
+# dbt runs
+# ------------------------------------------------------------------------------
+# dbt output is persisted in chunks of this size, or at least this often, while a run is going
+DBT_STDOUT_CHUNK_BYTES = env.int("DBT_STDOUT_CHUNK_BYTES", default=64 * 1024)
+DBT_STDOUT_FLUSH_SECONDS = env.float("DBT_STDOUT_FLUSH_SECONDS", default=2.0)
+# last lines of output kept on the DBTLogs row itself
+DBT_STDOUT_TAIL_LINES = env.int("DBT_STDOUT_TAIL_LINES", default=200)
+# partial parse state of earlier runs, restored into new runs so dbt can skip parsing
+DBT_PARSE_CACHE_PATH = os.path.join(THIS_PROJECT_PATH, "parse-cache")
+# commits kept per repo, profile and dbt version
+DBT_PARSE_CACHE_KEEP = env.int("DBT_PARSE_CACHE_KEEP", default=5)
+# "executor" hands single dbt commands to a dbt process kept warm between runs, "subprocess" starts dbt for every run
+DBT_EXECUTION_BACKEND = env("DBT_EXECUTION_BACKEND", default="subprocess")
+# interpreter of the executor, it must have dbt-core and the adapters installed
+DBT_EXECUTOR_PYTHON = env("DBT_EXECUTOR_PYTHON", default=sys.executable)
+# adapters imported when the executor starts
+DBT_EXECUTOR_ADAPTERS = env.list(
+    "DBT_EXECUTOR_ADAPTERS", default=["postgres", "redshift", "snowflake", "bigquery"]
+)
+# warm executors kept per profile by every worker process, and when they are replaced;
+# the pool is per process, so with the prefork pool every child keeps its own
+# (up to CELERY_WORKER_CONCURRENCY x DBT_EXECUTOR_POOL_SIZE dbt processes per profile)
+DBT_EXECUTOR_POOL_SIZE = env.int("DBT_EXECUTOR_POOL_SIZE", default=1)
+DBT_EXECUTOR_MAX_RUNS = env.int("DBT_EXECUTOR_MAX_RUNS", default=50)
+DBT_EXECUTOR_MAX_RSS_MB = env.int("DBT_EXECUTOR_MAX_RSS_MB", default=1024)
+DBT_EXECUTOR_IDLE_SECONDS = env.int("DBT_EXECUTOR_IDLE_SECONDS", default=3600)
+# run "dbt debug --connection" with the first profile of the ProfileYAML and its default target
+# when an executor starts, to load the profile and the database driver
+DBT_EXECUTOR_OPEN_CONNECTION = env.bool("DBT_EXECUTOR_OPEN_CONNECTION", default=False)
+# runs waiting for a slot of a profile or repo ask again this often;
+# a slot is leased for this long and renewed while the run goes on
+DBT_SLOT_RETRY_SECONDS = env.int("DBT_SLOT_RETRY_SECONDS", default=15)
+DBT_SLOT_LEASE_SECONDS = env.int("DBT_SLOT_LEASE_SECONDS", default=300)
+# queue position of tasks without a priority, lower goes first
+DBT_SLOT_DEFAULT_PRIORITY = env.int("DBT_SLOT_DEFAULT_PRIORITY", default=5)
+# a run is recognized as a duplicate for at most this long, in case its worker died without releasing it
+DBT_TRIGGER_DEDUP_SECONDS = env.int("DBT_TRIGGER_DEDUP_SECONDS", default=43200)
+# live status of a run is kept in Redis this long after its last change
+DBT_RUN_STATUS_SECONDS = env.int("DBT_RUN_STATUS_SECONDS", default=24 * 60 * 60)
+# longest a status long-poll or event stream is held open
+DBT_RUN_STATUS_MAX_WAIT_SECONDS = env.int("DBT_RUN_STATUS_MAX_WAIT_SECONDS", default=60)
+# finished runs of a task that keep their artifacts and output in the database, unless the task sets its own number
+DBT_RETENTION_KEEP_FULL_RUNS = env.int("DBT_RETENTION_KEEP_FULL_RUNS", default=20)
+# logs compacted per batch by compact_dbt_logs
+DBT_RETENTION_BATCH_SIZE = env.int("DBT_RETENTION_BATCH_SIZE", default=100)
+# artifacts and output of older runs are moved here as zstd files: one file per distinct
+# artifact (blobs/<digest>) and one directory per log for its output;
+# a mounted bucket works as well since files are only written once, under a key-like path
+DBT_ARCHIVE_PATH = env("DBT_ARCHIVE_PATH", default=os.path.join(THIS_PROJECT_PATH, "archive"))
+DBT_ARCHIVE_ZSTD_LEVEL = env.int("DBT_ARCHIVE_ZSTD_LEVEL", default=10)
+# "zstd" stores new artifacts as compressed frames instead of jsonb, they are decompressed when read;
+# both are written without reading the artifact into memory (jsonb is streamed with COPY on PostgreSQL)
+DBT_ARTIFACT_STORAGE = env("DBT_ARTIFACT_STORAGE", default="jsonb")
+DBT_ARTIFACT_ZSTD_LEVEL = env.int("DBT_ARTIFACT_ZSTD_LEVEL", default=3)
@@ -6,6 +6,9 @@ from django.contrib.auth.models import Group
 
 from django.contrib.sites.models import Site
 from django.forms.widgets import Select
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils.html import format_html_join
 from celery.utils import cached_property
 from django_celery_beat.admin import (
     PeriodicTaskAdmin as BasePeriodicTaskAdmin,
@@ -13,13 +16,18 @@ from django_celery_beat.admin import (
 )
 
 from dbt.analytics.models import (
+    DBT_LOG_HEAVY_FIELDS,
+    GIT_REPO_STATUS_PENDING,
     DBTLogs,
     GitRepo,
     ProfileYAML,
+    Run,
     SubProcessLog,
     PeriodicTask,
 )
-from dbt.utils.common import clone_git_repo
+from dbt.analytics.pipelines import upstream_cycle
+from dbt.utils.artifacts import ARTIFACT_NAMES
+from config.celery_app import schedule_git_repo_clone
 
 
 class GitRepoForm(ModelForm):
@@ -43,10 +51,60 @@ class DBTLogsLAdmin(admin.ModelAdmin):
         "profile_yml_used_name",
     ]
     readonly_fields = [
+        "executed_command",
         "repository_used_name",
         "periodic_task_name",
         "profile_yml_used_name",
+        "commit_sha",
+        "archived_at",
+        "archive_path",
+        "archived_artifacts",
+        "artifacts",
     ]
+    # artifacts are served one at a time by artifact_view instead
+    exclude = [
+        *DBT_LOG_HEAVY_FIELDS,
+        "manifest_blob",
+        "run_results_blob",
+        "sources_blob",
+        "catalog_blob",
+    ]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).summary()
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<path:object_id>/artifact/<str:name>/",
+                self.admin_site.admin_view(self.artifact_view),
+                name="analytics_dbtlogs_artifact",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def artifact_view(self, request, object_id, name):
+        dbt_log = self.get_object(request, object_id)
+        if dbt_log is None or name not in ARTIFACT_NAMES + ("dbt_stdout",):
+            raise Http404
+        if name == "dbt_stdout":
+            return StreamingHttpResponse(dbt_log.iter_stdout(), content_type="text/plain")
+        return HttpResponse(
+            dbt_log.get_artifact_json(name) or "null", content_type="application/json"
+        )
+
+    @admin.display(description="Artifacts")
+    def artifacts(self, obj):
+        if obj.pk is None:
+            return "-"
+        return format_html_join(
+            " | ",
+            '<a href="{}" target="_blank">{}</a>',
+            (
+                (reverse("admin:analytics_dbtlogs_artifact", args=[obj.pk, name]), name)
+                for name in ARTIFACT_NAMES + ("dbt_stdout",)
+            ),
+        )
 
 
 @admin.register(ProfileYAML)
@@ -73,16 +131,32 @@ class GitRepoAdmin(admin.ModelAdmin):
         "id",
         "name",
         "public_key",
+        "status",
+        "progress",
+        "synced_at",
     ]
+    readonly_fields = ["status", "status_message", "progress", "synced_at"]
 
     def save_model(self, request, obj, form, change):
+        obj.status = GIT_REPO_STATUS_PENDING
         obj.save()
-        result, msg = clone_git_repo(obj)
-        if result:
-            ...
-        else:
-            obj.delete()
-            messages.error(request, f"Something is wrong while git cloning {msg}")
+        schedule_git_repo_clone(obj)
+        messages.info(request, "The repository is being cloned in the background")
+
+
+@admin.register(Run)
+class RunAdmin(admin.ModelAdmin):
+    list_display = [
+        "run_id",
+        "periodic_task",
+        "status",
+        "success",
+        "created_at",
+        "execute_started_at",
+        "completed_at",
+    ]
+    list_filter = ["status"]
+    raw_id_fields = ["parent", "dbt_log"]
 
 
 @admin.register(SubProcessLog)
@@ -141,11 +215,27 @@ class PeriodicTaskForm(BasePeriodicTaskForm):
         exclude = ()
 
 
+class PipelineTaskForm(BasePeriodicTaskForm):
+    class Meta:
+        model = PeriodicTask
+        exclude = ()
+
+    def clean_upstream_tasks(self):
+        upstream_tasks = self.cleaned_data["upstream_tasks"]
+        if upstream_cycle(self.instance, upstream_tasks):
+            raise forms.ValidationError(
+                "A task cannot run after itself, directly or through its upstream tasks."
+            )
+        return upstream_tasks
+
+
 class PeriodicTaskAdmin(BasePeriodicTaskAdmin):
     # form = PeriodicTaskForm
+    form = PipelineTaskForm
     model = PeriodicTask
     list_display = ('__str__', 'id',  'enabled', 'interval', 'start_time',
                     'last_run_at', 'one_off')
+    filter_horizontal = ("upstream_tasks",)
     fieldsets = (
         (
             None,
@@ -154,6 +244,12 @@ class PeriodicTaskAdmin(BasePeriodicTaskAdmin):
                     "name",
                     "git_repo",
                     "profile_yml",
+                    "run_mode",
+                    "upstream_tasks",
+                    "shards",
+                    "when_unchanged",
+                    "run_on_new_data",
+                    "keep_full_runs",
                     "regtask",
                     "task",
                     "enabled",
@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from dbt.analytics.models import PeriodicTask
+from dbt.utils.slots import RunSlots
+
+
+def run_slots(task_id):
+    """The slots a run of the periodic task needs, or None when nothing limits it."""
+    periodic_task = (
+        PeriodicTask.objects.select_related("profile_yml", "git_repo").filter(id=task_id).first()
+    )
+    if periodic_task is None:
+        return None
+    limits = {}
+    if periodic_task.profile_yml and periodic_task.profile_yml.max_concurrent_runs:
+        limits[f"profile:{periodic_task.profile_yml_id}"] = (
+            periodic_task.profile_yml.max_concurrent_runs
+        )
+    if periodic_task.git_repo and periodic_task.git_repo.max_concurrent_runs:
+        limits[f"repo:{periodic_task.git_repo_id}"] = periodic_task.git_repo.max_concurrent_runs
+    if not limits:
+        return None
+    return RunSlots(limits)
+
+
+def run_priority(task_id):
+    priority = PeriodicTask.objects.filter(id=task_id).values_list("priority", flat=True).first()
+    return getattr(settings, "DBT_SLOT_DEFAULT_PRIORITY") if priority is None else priority
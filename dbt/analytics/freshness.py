@@ -0,0 +1,106 @@
+import tempfile
+
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+
+from dbt.analytics.models import DBTLogs, NodeRunResult, PeriodicTask
+from dbt.analytics.triggers import trigger_periodic_task
+from dbt.utils.artifact_schemas import Sources
+from dbt.utils.artifacts import artifact_path, decode_artifact_text
+from dbt.utils.sharding import upstream_sources
+from dbt.utils.state import write_state_manifest
+
+# upstream sources only change with the manifest, keep them for a day
+UPSTREAM_SOURCES_CACHE_SECONDS = 24 * 60 * 60
+
+
+def task_upstream_sources(periodic_task):
+    """Sources upstream of the nodes the task's last successful run ran, or None if unknown."""
+    last_success = DBTLogs.objects.last_successful(periodic_task.name)
+    if last_success is None:
+        return None
+    # keyed by the manifest, so runs that did not change the code share the entry
+    manifest_key = last_success.manifest_blob_id or f"log-{last_success.id}"
+    cache_key = f"dbt:upstream-sources:{periodic_task.id}:{manifest_key}"
+    sources = cache.get(cache_key)
+    if sources is not None:
+        return set(sources)
+    manifest_json = last_success.get_artifact_json("manifest")
+    if not manifest_json:
+        return None
+    node_ids = list(
+        NodeRunResult.objects.filter(dbt_log=last_success).values_list("unique_id", flat=True)
+    )
+    with tempfile.TemporaryDirectory() as state_dir:
+        write_state_manifest(manifest_json, state_dir)
+        sources = upstream_sources(artifact_path(state_dir, "manifest"), node_ids or None)
+    cache.set(cache_key, sorted(sources), UPSTREAM_SOURCES_CACHE_SECONDS)
+    return sources
+
+
+def latest_loaded_at(repository_name):
+    """``{source unique_id: max_loaded_at}`` from the latest sources.json of a repo."""
+    dbt_log = DBTLogs.objects.latest_sources(repository_name)
+    sources_json = dbt_log.get_artifact_json("sources") if dbt_log else None
+    if not sources_json:
+        return {}
+    sources = decode_artifact_text(sources_json, Sources)
+    loaded_at = {}
+    for result in sources.results:
+        max_loaded_at = parse_datetime(result.max_loaded_at or "")
+        if result.unique_id and max_loaded_at is not None:
+            loaded_at[result.unique_id] = max_loaded_at
+    return loaded_at
+
+
+def upstream_loaded_at(periodic_task):
+    """``{source unique_id: max_loaded_at}`` of the sources a task reads, as last
+    checked by ``dbt source freshness``; every source of the repo when unknown."""
+    if periodic_task.git_repo is None:
+        return {}
+    loaded_at = latest_loaded_at(periodic_task.git_repo.name)
+    sources = task_upstream_sources(periodic_task)
+    if sources is None:
+        return loaded_at
+    return {source: loaded_at[source] for source in sources if source in loaded_at}
+
+
+def sources_with_new_data(periodic_task, loaded_at):
+    """Upstream sources of the task loaded since it was last started for new data."""
+    sources = task_upstream_sources(periodic_task)
+    if sources is None:
+        # never ran successfully: any source of the repo counts
+        sources = set(loaded_at)
+    watermarks = periodic_task.source_watermarks or {}
+    return [
+        source
+        for source in sorted(sources & set(loaded_at))
+        if source not in watermarks
+        or loaded_at[source] > parse_datetime(watermarks[source])
+    ]
+
+
+def trigger_on_new_data():
+    """Start the tasks that run on new data whose upstream sources were loaded again."""
+    started = []
+    loaded_at_by_repo = {}
+    tasks = PeriodicTask.objects.filter(run_on_new_data=True, enabled=True).select_related(
+        "git_repo"
+    )
+    for periodic_task in tasks:
+        if periodic_task.git_repo is None:
+            continue
+        repository_name = periodic_task.git_repo.name
+        if repository_name not in loaded_at_by_repo:
+            loaded_at_by_repo[repository_name] = latest_loaded_at(repository_name)
+        loaded_at = loaded_at_by_repo[repository_name]
+        sources = sources_with_new_data(periodic_task, loaded_at)
+        if not sources:
+            continue
+        celery_task_id, _ = trigger_periodic_task(periodic_task, triggered_by="new_data")
+        watermarks = dict(periodic_task.source_watermarks or {})
+        watermarks.update({source: loaded_at[source].isoformat() for source in sources})
+        PeriodicTask.objects.filter(pk=periodic_task.pk).update(source_watermarks=watermarks)
+        print(f"New data in {', '.join(sources)}: started {periodic_task.name} ({celery_task_id})")
+        started.append(periodic_task)
+    return started
@@ -0,0 +1,281 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.db.models import JSONField, Value
+from django.db.models.functions import Cast
+from django.utils.dateparse import parse_datetime
+
+from dbt.analytics.lineage import index_manifest
+from dbt.analytics.models import (
+    ARTIFACT_STORAGE_ZSTD,
+    Args,
+    ArtifactBlob,
+    DBTLogChunk,
+    DBTLogs,
+    NodeRunResult,
+)
+from dbt.utils.artifact_schemas import RunResults, Timing
+from dbt.utils.artifacts import (
+    ARTIFACT_NAMES,
+    QuotedArtifact,
+    artifact_path,
+    decode_artifact,
+    hash_artifact,
+    read_artifact_text,
+)
+from dbt.utils.compression import compress_file
+
+NODE_RESULTS_BATCH_SIZE = 500
+# the artifact is one field quoted by COPY_QUOTE; the delimiter does not occur either
+COPY_ARTIFACT_SQL = (
+    "COPY dbt_artifact_staging (content) FROM STDIN "
+    "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+)
+
+
+def compress_artifact(file_path):
+    """The zstd frame a new blob is stored as, None when blobs are stored as jsonb."""
+    if getattr(settings, "DBT_ARTIFACT_STORAGE") != ARTIFACT_STORAGE_ZSTD:
+        return None
+    return compress_file(file_path, getattr(settings, "DBT_ARTIFACT_ZSTD_LEVEL"))
+
+
+def find_blob(digest):
+    """The blob for ``digest``, locked until the transaction ends so that
+    compaction cannot delete it before a log points at it."""
+    return ArtifactBlob.objects.select_for_update().only("id", "digest").filter(digest=digest).first()
+
+
+def copy_blob_content(blob, file_path):
+    """Stream an artifact file into ``blob.content`` with COPY (PostgreSQL only).
+
+    The file goes to the server in chunks and is cast to jsonb there, so the
+    worker's memory does not grow with the size of the artifact. The staging
+    table holds only this artifact, whatever transaction the caller is in.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS dbt_artifact_staging (content text) "
+            "ON COMMIT DELETE ROWS"
+        )
+        # rows of artifacts copied earlier in the same transaction
+        cursor.execute("DELETE FROM dbt_artifact_staging")
+        with open(file_path, "rb") as artifact:
+            cursor.copy_expert(COPY_ARTIFACT_SQL, QuotedArtifact(artifact))
+        cursor.execute(
+            f"UPDATE {ArtifactBlob._meta.db_table} "
+            "SET content = (SELECT content::jsonb FROM dbt_artifact_staging) WHERE id = %s",
+            [blob.pk],
+        )
+        cursor.execute("DELETE FROM dbt_artifact_staging")
+
+
+def create_blob(digest, size, file_path, compressed=None):
+    """Store a new blob; ``compressed`` is the file already run through compress_artifact.
+
+    As jsonb the file is streamed on PostgreSQL; other databases are sent the
+    whole text, which takes as much memory as the file is large.
+    """
+    text = None
+    stream = False
+    if compressed is None:
+        compressed = compress_artifact(file_path)
+    if compressed is None:
+        stream = connection.vendor == "postgresql"
+        if not stream:
+            # the text is read only now, so a single artifact is in memory at a time
+            text = read_artifact_text(file_path)
+            if text is None:
+                return None
+    try:
+        with transaction.atomic():
+            blob = ArtifactBlob.objects.create(digest=digest, size=size, compressed=compressed)
+            if stream:
+                copy_blob_content(blob, file_path)
+            elif text is not None:
+                ArtifactBlob.objects.filter(pk=blob.pk).update(
+                    content=Cast(Value(text), output_field=JSONField())
+                )
+    except IntegrityError:
+        # another worker stored the same content in the meantime
+        blob = find_blob(digest)
+    except (DataError, OSError) as err:
+        print(f"{file_path} could not be stored: {err}")
+        return None
+    return blob
+
+
+def get_or_create_blob(digest, size, file_path):
+    """Return the blob for ``digest``, reading the file only when it is new.
+
+    Call it in a transaction: the blob stays locked until the log points at it.
+    """
+    return find_blob(digest) or create_blob(digest, size, file_path)
+
+
+def save_artifact(dbt_log, name, file_path):
+    """Point ``dbt_log`` at the blob holding the artifact file."""
+    digest, size = hash_artifact(file_path)
+    if digest is None:
+        return None
+    with transaction.atomic():
+        blob = get_or_create_blob(digest, size, file_path)
+        if blob is not None:
+            DBTLogs.objects.filter(pk=dbt_log.pk).update(**{f"{name}_blob": blob})
+    if blob is not None:
+        setattr(dbt_log, f"{name}_blob", blob)
+    return blob
+
+
+def load_run_results(target_dir):
+    """The run_results.json of a run, empty when dbt did not write one."""
+    return decode_artifact(artifact_path(target_dir, "run_results"), RunResults) or RunResults()
+
+
+def save_args(dbt_log, run_results):
+    args = run_results.args
+    return Args.objects.create(
+        dbt_log=dbt_log,
+        quiet=args.get("quiet", ""),
+        which=args.get("which", ""),
+        no_print=args.get("no_print", ""),
+        rpc_method=args.get("rpc_method", ""),
+        use_colors=args.get("use_colors", ""),
+        write_json=args.get("write_json", ""),
+        profiles_dir=args.get("profiles_dir", ""),
+        partial_parse=args.get("partial_parse", ""),
+        printer_width=args.get("printer_width", ""),
+        static_parser=args.get("static_parser", ""),
+        version_check=args.get("version_check", ""),
+        event_buffer_size=args.get("event_buffer_size", ""),
+        indirect_selection=args.get("indirect_selection", ""),
+        send_anonymous=args.get("send_anonymous_usage_stats", ""),
+        usage_stats=args.get("usage_stats", ""),
+    )
+
+
+def build_node_result(dbt_log, result):
+    timing = {phase.name: phase for phase in result.timing}
+    compile_timing = timing.get("compile", Timing())
+    execute_timing = timing.get("execute", Timing())
+    adapter_response = result.adapter_response
+    rows_affected = (
+        adapter_response.get("rows_affected") if isinstance(adapter_response, dict) else None
+    )
+    return NodeRunResult(
+        dbt_log=dbt_log,
+        unique_id=result.unique_id,
+        status=str(result.status) if result.status is not None else None,
+        execution_time=result.execution_time,
+        rows_affected=rows_affected if isinstance(rows_affected, int) else None,
+        thread_id=str(result.thread_id) if result.thread_id is not None else None,
+        message=result.message,
+        compile_started_at=parse_datetime(compile_timing.started_at or ""),
+        compile_completed_at=parse_datetime(compile_timing.completed_at or ""),
+        execute_started_at=parse_datetime(execute_timing.started_at or ""),
+        execute_completed_at=parse_datetime(execute_timing.completed_at or ""),
+        created_at=dbt_log.created_at,
+    )
+
+
+def save_node_results(dbt_log, run_results):
+    """Explode run_results into NodeRunResult rows, inserted in batches."""
+    count = 0
+    results = run_results.results
+    for start in range(0, len(results), NODE_RESULTS_BATCH_SIZE):
+        batch = [
+            build_node_result(dbt_log, result)
+            for result in results[start : start + NODE_RESULTS_BATCH_SIZE]
+        ]
+        NodeRunResult.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def ingest_artifacts(dbt_log, target_dir):
+    """Attach the artifacts found in ``target_dir`` to an existing ``dbt_log``.
+
+    The files are hashed, compressed and run_results.json decoded in a thread
+    pool, as hashing, zstd and file reads let other threads run meanwhile. The
+    database is only used from the calling thread. An artifact whose content
+    was already stored by an earlier run only costs a hash of the file and a
+    lookup.
+    """
+    paths = {name: artifact_path(target_dir, name) for name in ARTIFACT_NAMES}
+    with ThreadPoolExecutor(max_workers=len(paths) + 1) as pool:
+        run_results = pool.submit(load_run_results, target_dir)
+        hashes = {
+            name: (digest, size)
+            for name, (digest, size) in zip(paths, pool.map(hash_artifact, paths.values()))
+            if digest
+        }
+        known = set(
+            ArtifactBlob.objects.filter(
+                digest__in=[digest for digest, _ in hashes.values()]
+            ).values_list("digest", flat=True)
+        )
+        new = [name for name, (digest, _) in hashes.items() if digest not in known]
+        compressed = dict(zip(new, pool.map(compress_artifact, [paths[name] for name in new])))
+    with transaction.atomic():
+        # the blobs are locked from the lookup until the log points at them
+        blobs = {}
+        for name, (digest, size) in hashes.items():
+            blob = find_blob(digest) or create_blob(
+                digest, size, paths[name], compressed.get(name)
+            )
+            if blob is not None:
+                blobs[f"{name}_blob"] = blob
+        if blobs:
+            DBTLogs.objects.filter(pk=dbt_log.pk).update(**blobs)
+    for field, blob in blobs.items():
+        setattr(dbt_log, field, blob)
+    # the artifacts are kept even when run_results.json does not decode, the
+    # run then fails with the error
+    run_results = run_results.result()
+    save_args(dbt_log, run_results)
+    save_node_results(dbt_log, run_results)
+    index_manifest(blobs.get("manifest_blob"), paths["manifest"])
+
+
+class StdoutChunkWriter:
+    """Append dbt output to ``dbt_log`` as numbered chunks while the run is going.
+
+    Only the current chunk and the last ``DBT_STDOUT_TAIL_LINES`` lines are
+    kept in memory, however long the run is.
+    """
+
+    def __init__(self, dbt_log):
+        self.dbt_log = dbt_log
+        self.chunk_bytes = getattr(settings, "DBT_STDOUT_CHUNK_BYTES")
+        self.flush_seconds = getattr(settings, "DBT_STDOUT_FLUSH_SECONDS")
+        self.tail = deque(maxlen=getattr(settings, "DBT_STDOUT_TAIL_LINES"))
+        self.seq = 0
+        self._lines = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+
+    def write(self, line):
+        self._lines.append(line)
+        self._size += len(line)
+        self.tail.append(line)
+        if (
+            self._size >= self.chunk_bytes
+            or time.monotonic() - self._flushed_at >= self.flush_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            DBTLogChunk.objects.create(
+                dbt_log=self.dbt_log, seq=self.seq, content="".join(self._lines)
+            )
+            self.seq += 1
+            self._lines = []
+            self._size = 0
+        self._flushed_at = time.monotonic()
+
+    def tail_text(self):
+        return "".join(self.tail)
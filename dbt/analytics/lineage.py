@@ -0,0 +1,89 @@
+from functools import lru_cache
+
+from django.db import IntegrityError
+
+from dbt.analytics.models import DBTLogs, ManifestLineage, PeriodicTask
+from dbt.utils.lineage import LineageGraph, build_lineage
+
+# lineage graphs kept decoded by every process, newest manifests first
+LINEAGE_CACHE_SIZE = 16
+
+
+def save_lineage(manifest_blob_id, graph):
+    try:
+        ManifestLineage.objects.get_or_create(
+            manifest_blob_id=manifest_blob_id,
+            defaults={
+                "graph": graph.to_bytes(),
+                "node_count": len(graph.node_ids),
+                "edge_count": graph.edge_count,
+            },
+        )
+    except IntegrityError:
+        # another worker indexed the same manifest in the meantime
+        pass
+
+
+def index_manifest(manifest_blob, manifest_path):
+    """Build the lineage of a manifest the first time it is stored."""
+    if manifest_blob is None:
+        return
+    if ManifestLineage.objects.filter(manifest_blob_id=manifest_blob.id).exists():
+        return
+    graph = build_lineage(manifest_path=manifest_path)
+    if graph is not None:
+        save_lineage(manifest_blob.id, graph)
+
+
+class LineageUnavailable(Exception):
+    """No lineage can be built for a manifest blob (yet)."""
+
+
+@lru_cache(maxsize=LINEAGE_CACHE_SIZE)
+def cached_lineage(manifest_blob_id):
+    """The lineage of a stored manifest; blobs never change, so it is cached by id.
+
+    Raises LineageUnavailable instead of returning None, so that a miss is
+    not cached and the graph is looked up again next time.
+    """
+    data = (
+        ManifestLineage.objects.filter(manifest_blob_id=manifest_blob_id)
+        .values_list("graph", flat=True)
+        .first()
+    )
+    if data is not None:
+        return LineageGraph.from_bytes(bytes(data))
+    # manifests stored before lineage was indexed are indexed on first use
+    dbt_log = DBTLogs.objects.summary().filter(manifest_blob_id=manifest_blob_id).first()
+    manifest_json = dbt_log.get_artifact_json("manifest") if dbt_log is not None else None
+    graph = build_lineage(manifest_text=manifest_json) if manifest_json else None
+    if graph is None:
+        raise LineageUnavailable(manifest_blob_id)
+    save_lineage(manifest_blob_id, graph)
+    return graph
+
+
+def load_lineage(manifest_blob_id):
+    """The lineage of a stored manifest, or None when there is none."""
+    try:
+        return cached_lineage(manifest_blob_id)
+    except LineageUnavailable:
+        return None
+
+
+def lineage_manifest_log(dbt_log_id=None, task_id=None, repository=None):
+    """The run whose manifest a lineage query reads: the given run, the last
+    successful run of the given task, or the latest run of the given repository
+    with a manifest. One of them is required, repositories have different projects."""
+    logs = DBTLogs.objects.summary().filter(manifest_blob__isnull=False)
+    if dbt_log_id is not None:
+        return logs.filter(pk=dbt_log_id).first()
+    if task_id is not None:
+        periodic_task = PeriodicTask.objects.filter(pk=task_id).first()
+        if periodic_task is None:
+            return None
+        dbt_log = DBTLogs.objects.last_successful(periodic_task.name)
+        return dbt_log if dbt_log is not None and dbt_log.manifest_blob_id else None
+    if repository is not None:
+        return logs.filter(repository_used_name=repository).order_by("-id").first()
+    raise ValueError("A run, task or repository is required")
@@ -1,8 +1,10 @@
 import os
+from datetime import timedelta
 from django_celery_beat.models import PeriodicTasks
 from django.forms import ValidationError
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.db.models import (
     Model,
     SET_NULL,
@@ -16,10 +18,36 @@ from django.db.models import (
     JSONField,
     OneToOneField,
     BigAutoField,
+    PROTECT,
+    PositiveBigIntegerField,
+    BinaryField,
+    BigIntegerField,
+    FloatField,
+    Index,
+    PositiveIntegerField,
+    UniqueConstraint,
+    Avg,
 )
 from django_celery_beat.models import PeriodicTask as BasePeriodicTaskModel
 from dbt.utils.common import save_profile_yml
+from dbt.utils.archive import (
+    STDOUT_ARCHIVE_NAME,
+    blob_archive_dir,
+    blob_archive_name,
+    read_archive_file,
+)
+from dbt.utils.artifacts import ARTIFACT_NAMES
+from dbt.utils.compression import decompress_text
+from dbt.utils.run_status import (
+    RUN_STATUS_CLONING,
+    RUN_STATUS_DONE,
+    RUN_STATUS_INGESTING,
+    RUN_STATUS_PARSING,
+    RUN_STATUS_QUEUED,
+    RUN_STATUS_RUNNING,
+)
 from django.db.models.query import QuerySet
+from django.db.models.functions import Cast
 
 PROFILE_NAME_DEV = "DEV"
 PROFILE_NAME_PROD = "PROD"
@@ -28,6 +56,45 @@ PROFILE_NAME_CHOICES = [
     (PROFILE_NAME_DEV, "DEV"),
     (PROFILE_NAME_PROD, "PROD"),
 ]
+GIT_REPO_STATUS_PENDING = "pending"
+GIT_REPO_STATUS_CLONING = "cloning"
+GIT_REPO_STATUS_READY = "ready"
+GIT_REPO_STATUS_FAILED = "failed"
+GIT_REPO_STATUS_CHOICES = [
+    (GIT_REPO_STATUS_PENDING, "Pending"),
+    (GIT_REPO_STATUS_CLONING, "Cloning"),
+    (GIT_REPO_STATUS_READY, "Ready"),
+    (GIT_REPO_STATUS_FAILED, "Failed"),
+]
+RUN_MODE_FULL = "full"
+RUN_MODE_STATE_MODIFIED = "state_modified"
+RUN_MODE_DEFER = "defer"
+RUN_MODE_CHOICES = [
+    (RUN_MODE_FULL, "Full"),
+    (RUN_MODE_STATE_MODIFIED, "Modified since the last successful run"),
+    (RUN_MODE_DEFER, "Defer to the last successful run"),
+]
+WHEN_UNCHANGED_RUN = "run"
+WHEN_UNCHANGED_SKIP = "skip"
+WHEN_UNCHANGED_FRESHNESS = "freshness"
+WHEN_UNCHANGED_CHOICES = [
+    (WHEN_UNCHANGED_RUN, "Run anyway"),
+    (WHEN_UNCHANGED_SKIP, "Skip"),
+    (WHEN_UNCHANGED_FRESHNESS, "Only check source freshness"),
+]
+RUN_STATUS_CHOICES = [
+    (RUN_STATUS_QUEUED, "Queued"),
+    (RUN_STATUS_CLONING, "Pulling"),
+    (RUN_STATUS_PARSING, "Parsing"),
+    (RUN_STATUS_RUNNING, "Executing"),
+    (RUN_STATUS_INGESTING, "Ingesting"),
+    (RUN_STATUS_DONE, "Done"),
+]
+
+# how new artifact blobs are stored, set by DBT_ARTIFACT_STORAGE
+ARTIFACT_STORAGE_JSONB = "jsonb"
+ARTIFACT_STORAGE_ZSTD = "zstd"
+
 SSH_KEY_PREFIX = getattr(settings, "SSH_KEY_PREFIX")
 
 
@@ -75,6 +142,29 @@ class PeriodicTask(BasePeriodicTaskModel):
         null=True,
         blank=True,
     )
+    run_mode = CharField(max_length=16, choices=RUN_MODE_CHOICES, default=RUN_MODE_FULL)
+    # a task with upstream tasks only runs once all of them succeeded
+    upstream_tasks = models.ManyToManyField(
+        "self", symmetrical=False, related_name="downstream_tasks", blank=True
+    )
+    # split a whole-project run over this many workers
+    shards = PositiveIntegerField(default=1)
+    # what to do when the commit, profile and command are those of the last successful run
+    when_unchanged = CharField(
+        max_length=16, choices=WHEN_UNCHANGED_CHOICES, default=WHEN_UNCHANGED_RUN
+    )
+    # run when an upstream source got new data, as seen by the latest
+    # "dbt source freshness" of the repo, instead of on the task's own schedule
+    run_on_new_data = BooleanField(default=False)
+    # max_loaded_at of every upstream source when the task was last started for new data
+    source_watermarks = JSONField(default=dict, blank=True)
+    # finished runs whose artifacts and output stay in the database, the
+    # DBT_RETENTION_KEEP_FULL_RUNS setting when empty
+    keep_full_runs = PositiveIntegerField(null=True, blank=True)
+    # the latest run of the task, kept up to date as runs start
+    last_dbt_log = ForeignKey(
+        "DBTLogs", on_delete=SET_NULL, related_name="+", null=True, blank=True
+    )
 
     def save(self, *args, **kwargs):
         # # replace ' to " in args
@@ -101,6 +191,8 @@ class ProfileYAML(Model):
         null=True,
         blank=True,
     )
+    # runs using this profile at the same time, 0 for no limit
+    max_concurrent_runs = PositiveIntegerField(default=0)
 
     def save(self, *args, **kwargs):
         save_profile_yml(self.profile_yml, ".dbt/profiles.yml")
@@ -139,6 +231,15 @@ class GitRepo(Model):
     name = CharField(max_length=255, blank=True, null=True)
     url = CharField(help_text="add with personal token", max_length=600)
     ssh_key = OneToOneField(SSHKey, blank=True, null=True, on_delete=CASCADE)
+    # cloning happens in the background, these follow its progress
+    status = CharField(
+        max_length=16, choices=GIT_REPO_STATUS_CHOICES, default=GIT_REPO_STATUS_PENDING
+    )
+    status_message = TextField(null=True, blank=True)
+    progress = PositiveIntegerField(default=0)
+    synced_at = DateTimeField(null=True, blank=True)
+    # runs of this repo at the same time, 0 for no limit
+    max_concurrent_runs = PositiveIntegerField(default=0)
 
     def public_key(self):
         if self.ssh_key:
@@ -186,14 +287,180 @@ class SubProcessLog(Model):
         verbose_name_plural = "SubProcessLogs"
 
 
+class PipelineDispatch(Model):
+    """A downstream task started by a pipeline run; it is started only once per run."""
+
+    pipeline_run_id = CharField(max_length=64)
+    periodic_task = ForeignKey(PeriodicTask, on_delete=CASCADE, related_name="+")
+    created_at = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Pipeline Dispatch"
+        verbose_name_plural = "Pipeline Dispatches"
+        constraints = [
+            UniqueConstraint(
+                fields=["pipeline_run_id", "periodic_task"],
+                name="unique_pipeline_dispatch",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.pipeline_run_id}:{self.periodic_task_id}"
+
+
+class ArtifactBlob(Model):
+    """A dbt artifact stored once per distinct content, keyed by its sha256."""
+
+    digest = CharField(max_length=64, unique=True)
+    content = JSONField(null=True, blank=True)
+    # the artifact as a zstd frame instead of content, when stored compressed
+    compressed = BinaryField(null=True, blank=True)
+    size = PositiveBigIntegerField(default=0)
+    created_at = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Artifact Blob"
+        verbose_name_plural = "Artifact Blobs"
+
+    def __str__(self):
+        return self.digest
+
+    @classmethod
+    def json_text(cls, blob_id):
+        """The content of a blob as JSON text, serialized by the database or decompressed."""
+        row = (
+            cls.objects.filter(pk=blob_id)
+            .annotate(json_text=Cast("content", output_field=TextField()))
+            .values_list("json_text", "compressed")
+            .first()
+        )
+        json_text, compressed = row or (None, None)
+        if compressed is not None:
+            return decompress_text(compressed)
+        return json_text
+
+
+class ManifestLineage(Model):
+    """Lineage of every node of a manifest, built once per distinct manifest.
+
+    ``graph`` is a dbt.utils.lineage.LineageGraph in its serialized form.
+    """
+
+    manifest_blob = OneToOneField(ArtifactBlob, on_delete=CASCADE, related_name="lineage")
+    graph = BinaryField()
+    node_count = PositiveIntegerField(default=0)
+    edge_count = PositiveIntegerField(default=0)
+    created_at = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Manifest Lineage"
+        verbose_name_plural = "Manifest Lineages"
+
+    def __str__(self):
+        return str(self.manifest_blob_id)
+
+
+# columns that can hold megabytes and are never needed to list logs
+DBT_LOG_HEAVY_FIELDS = ARTIFACT_NAMES + ("dbt_stdout",)
+
+
+class DBTLogsQuerySet(QuerySet):
+    def summary(self):
+        return self.defer(*DBT_LOG_HEAVY_FIELDS)
+
+    def create_for_task(self, periodic_task, **fields):
+        """Create the log of a run of ``periodic_task`` and make it the task's last run."""
+        previous_command = None
+        if periodic_task.last_dbt_log_id is not None:
+            previous_command = (
+                self.filter(pk=periodic_task.last_dbt_log_id)
+                .values_list("command", flat=True)
+                .first()
+            )
+        dbt_log = self.create(
+            periodic_task_name=periodic_task.name,
+            previous_command=previous_command or "this is first commands",
+            **fields,
+        )
+        if dbt_log.parent_id is None:
+            PeriodicTask.objects.filter(pk=periodic_task.pk).update(last_dbt_log=dbt_log)
+        return dbt_log
+
+    def history(self, periodic_task_name, before=None):
+        """Runs of a task, newest first; ``before`` is the id the previous page ended at."""
+        queryset = self.summary().filter(
+            periodic_task_name=periodic_task_name, parent__isnull=True
+        )
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+        return queryset.order_by("-id")
+
+    def last_run(self, periodic_task_name):
+        """The latest finished run of a task that was not skipped."""
+        return (
+            self.summary()
+            .filter(
+                periodic_task_name=periodic_task_name,
+                skipped=False,
+                parent__isnull=True,
+                completed_at__isnull=False,
+            )
+            .order_by("-id")
+            .first()
+        )
+
+    def latest_sources(self, repository_name):
+        """The latest run of a repo that stored sources.json (dbt source freshness)."""
+        return (
+            self.summary()
+            .filter(repository_used_name=repository_name)
+            .exclude(sources_blob__isnull=True, sources__isnull=True)
+            .order_by("-id")
+            .first()
+        )
+
+    def last_successful(self, periodic_task_name):
+        """The latest successful run of a task that stored a manifest."""
+        return (
+            self.summary()
+            .filter(
+                periodic_task_name=periodic_task_name,
+                success=True,
+                skipped=False,
+                parent__isnull=True,
+            )
+            .exclude(manifest_blob__isnull=True, manifest__isnull=True)
+            .order_by("-id")
+            .first()
+        )
+
+
 class DBTLogs(Model):
+    # inline artifacts of runs logged before the blob store existed
     manifest = JSONField(null=True, blank=True)
     run_results = JSONField(null=True, blank=True)
     sources = JSONField(null=True, blank=True)
     catalog = JSONField(null=True, blank=True)
-    command = CharField(max_length=255, null=True, blank=True)
-    previous_command = CharField(max_length=255, null=True, blank=True)
-    success = BooleanField(default=True)
+    manifest_blob = ForeignKey(
+        ArtifactBlob, on_delete=PROTECT, related_name="+", null=True, blank=True
+    )
+    run_results_blob = ForeignKey(
+        ArtifactBlob, on_delete=PROTECT, related_name="+", null=True, blank=True
+    )
+    sources_blob = ForeignKey(
+        ArtifactBlob, on_delete=PROTECT, related_name="+", null=True, blank=True
+    )
+    catalog_blob = ForeignKey(
+        ArtifactBlob, on_delete=PROTECT, related_name="+", null=True, blank=True
+    )
+    # the command of the task, as the user wrote it
+    command = TextField(null=True, blank=True)
+    previous_command = TextField(null=True, blank=True)
+    # the command dbt was started with, when it differs from ``command``:
+    # with --state/--defer added, or downgraded to a freshness check
+    executed_command = TextField(null=True, blank=True)
+    # None while the run is going, or when it never finished
+    success = BooleanField(null=True, blank=True)
     fail_reason = TextField(null=True, blank=True, max_length=10000)
     repository_used_name = CharField(max_length=255, null=True, blank=True)
     created_at = DateTimeField(auto_now_add=True)
@@ -201,14 +468,185 @@ class DBTLogs(Model):
     periodic_task_name = CharField(max_length=255, null=True, blank=True)
     profile_yml_used_name = CharField(max_length=255, null=True, blank=True)
     dbt_stdout = TextField(null=True, blank=True, )
+    commit_sha = CharField(max_length=40, null=True, blank=True)
+    # celery task id of the run, returned when it is triggered
+    run_id = CharField(max_length=64, null=True, blank=True, db_index=True)
+    # shared by the runs of one pipeline, from its first task down
+    pipeline_run_id = CharField(max_length=64, null=True, blank=True, db_index=True)
+    # the run a shard is part of; its results are merged into that run
+    parent = ForeignKey(
+        "self", on_delete=CASCADE, related_name="shard_logs", null=True, blank=True
+    )
+    profile_hash = CharField(max_length=64, null=True, blank=True)
+    # hash of the command, commit and profile, equal for runs that would do the same
+    fingerprint = CharField(max_length=64, null=True, blank=True)
+    # the command was not run because nothing changed since the last successful run
+    skipped = BooleanField(default=False)
+    # the output was moved to DBT_ARCHIVE_PATH/<archive_path>, the artifacts
+    # to the archive file of their blob, ``{artifact name: blob digest}``
+    archived_at = DateTimeField(null=True, blank=True)
+    archive_path = CharField(max_length=255, null=True, blank=True)
+    archived_artifacts = JSONField(null=True, blank=True)
+
+    objects = DBTLogsQuerySet.as_manager()
 
     class Meta:
         verbose_name = "DBT Log"
         verbose_name_plural = "DBT Logs"
+        # the latest runs of a task or repo are read by id, newest first
+        indexes = [
+            Index(fields=["periodic_task_name", "-id"]),
+            Index(fields=["repository_used_name", "-id"]),
+        ]
 
     def __str__(self):
         return str(self.created_at)
 
+    def get_artifact_json(self, name):
+        """Return one artifact as JSON text, serialized by the database or decompressed."""
+        if name not in ARTIFACT_NAMES:
+            raise ValueError(f"Unknown artifact {name}")
+        blob_id = getattr(self, f"{name}_blob_id")
+        if blob_id is not None:
+            return ArtifactBlob.json_text(blob_id)
+        if self.archive_path:
+            return self.read_archived_artifact(name)
+        queryset = DBTLogs.objects.filter(pk=self.pk).annotate(
+            json_text=Cast(name, output_field=TextField())
+        )
+        return queryset.values_list("json_text", flat=True).first()
+
+    def read_archived_artifact(self, name):
+        digest = (self.archived_artifacts or {}).get(name)
+        if digest is None:
+            return None
+        return read_archive_file(blob_archive_dir(digest), blob_archive_name(digest))
+
+    def iter_stdout(self):
+        """Yield the dbt output chunk by chunk, falling back to ``dbt_stdout``."""
+        chunks = self.stdout_chunks.order_by("seq").values_list("content", flat=True)
+        if not chunks.exists():
+            if self.archive_path:
+                yield read_archive_file(self.archive_path, STDOUT_ARCHIVE_NAME) or ""
+                return
+            yield self.dbt_stdout or ""
+            return
+        yield from chunks.iterator()
+
+
+class Run(Model):
+    """A run from the moment a worker picks it up, with the time it entered each phase.
+
+    Only small columns live here; the output and artifacts stay on ``dbt_log``,
+    which is attached once the run has one.
+    """
+
+    # celery task id of the run, the run_id handed out when it was triggered
+    run_id = CharField(max_length=64, unique=True)
+    periodic_task = ForeignKey(
+        PeriodicTask, on_delete=SET_NULL, related_name="runs", null=True, blank=True
+    )
+    command = TextField(null=True, blank=True)
+    status = CharField(max_length=16, choices=RUN_STATUS_CHOICES, default=RUN_STATUS_QUEUED)
+    # the run a shard is part of
+    parent = ForeignKey(
+        "self", on_delete=CASCADE, related_name="shard_runs", null=True, blank=True
+    )
+    dbt_log = OneToOneField(
+        DBTLogs, on_delete=SET_NULL, related_name="run", null=True, blank=True
+    )
+    success = BooleanField(null=True, blank=True)
+    skipped = BooleanField(default=False)
+    created_at = DateTimeField(auto_now_add=True)
+    pull_started_at = DateTimeField(null=True, blank=True)
+    parse_started_at = DateTimeField(null=True, blank=True)
+    execute_started_at = DateTimeField(null=True, blank=True)
+    ingest_started_at = DateTimeField(null=True, blank=True)
+    completed_at = DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Run"
+        verbose_name_plural = "Runs"
+        indexes = [
+            Index(fields=["status", "-created_at"]),
+        ]
+
+    def __str__(self):
+        return self.run_id
+
+
+class DBTLogChunk(Model):
+    """An append-only piece of dbt output, written while the run is going."""
+
+    dbt_log = ForeignKey(DBTLogs, on_delete=CASCADE, related_name="stdout_chunks")
+    seq = PositiveIntegerField()
+    content = TextField()
+    created_at = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "DBT Log Chunk"
+        verbose_name_plural = "DBT Log Chunks"
+        constraints = [
+            UniqueConstraint(fields=["dbt_log", "seq"], name="unique_dbt_log_chunk_seq")
+        ]
+
+    def __str__(self):
+        return f"{self.dbt_log_id}:{self.seq}"
+
+
+class NodeRunResultQuerySet(QuerySet):
+    def for_node(self, unique_id, days=None):
+        queryset = self.filter(unique_id=unique_id)
+        if days is not None:
+            queryset = queryset.filter(
+                created_at__gte=timezone.now() - timedelta(days=days)
+            )
+        return queryset.order_by("-created_at")
+
+    def average_execution_times(self, unique_ids, days=7):
+        """Mean execution time of each node over the last ``days``."""
+        rows = (
+            self.filter(
+                unique_id__in=unique_ids,
+                created_at__gte=timezone.now() - timedelta(days=days),
+                execution_time__isnull=False,
+            )
+            .values("unique_id")
+            .annotate(seconds=Avg("execution_time"))
+        )
+        return {row["unique_id"]: row["seconds"] for row in rows}
+
+
+class NodeRunResult(Model):
+    """One entry of run_results.json, kept in its own indexed row."""
+
+    dbt_log = ForeignKey(DBTLogs, on_delete=CASCADE, related_name="node_results")
+    unique_id = CharField(max_length=512)
+    status = CharField(max_length=64, null=True, blank=True)
+    execution_time = FloatField(null=True, blank=True)
+    rows_affected = BigIntegerField(null=True, blank=True)
+    thread_id = CharField(max_length=255, null=True, blank=True)
+    message = TextField(null=True, blank=True)
+    compile_started_at = DateTimeField(null=True, blank=True)
+    compile_completed_at = DateTimeField(null=True, blank=True)
+    execute_started_at = DateTimeField(null=True, blank=True)
+    execute_completed_at = DateTimeField(null=True, blank=True)
+    # copied from the log so trends per node are answered by a single index
+    created_at = DateTimeField()
+
+    objects = NodeRunResultQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Node Run Result"
+        verbose_name_plural = "Node Run Results"
+        indexes = [
+            Index(fields=["unique_id", "created_at"]),
+            Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return self.unique_id
+
 
 class Args(Model):
     alias = BigAutoField(primary_key=True, unique=True)
@@ -0,0 +1,97 @@
+import json
+
+from django.db import IntegrityError, transaction
+
+from dbt.analytics.models import DBTLogs, PeriodicTask, PipelineDispatch
+
+
+def upstream_cycle(periodic_task, upstream_tasks):
+    """True when ``upstream_tasks`` as the upstream of ``periodic_task`` would make
+    it wait for itself, directly or through the upstream tasks of those."""
+    if periodic_task is None or periodic_task.pk is None:
+        # nothing is downstream of a task that does not exist yet
+        return False
+    seen = set()
+    pending = {task.pk for task in upstream_tasks}
+    while pending:
+        if periodic_task.pk in pending:
+            return True
+        seen |= pending
+        pending = set(
+            PeriodicTask.objects.filter(downstream_tasks__in=pending)
+            .exclude(pk__in=seen)
+            .values_list("pk", flat=True)
+        )
+    return False
+
+
+def waiting_for(periodic_task, pipeline_run_id):
+    """Upstream tasks of ``periodic_task`` it still waits for in this pipeline run.
+
+    An upstream task is done when it succeeded in the same pipeline run. Upstream
+    tasks that start pipelines of their own (scheduled roots) run under another
+    pipeline_run_id; they count as done when their latest run succeeded after
+    ``periodic_task`` last started, so separately scheduled roots join.
+    """
+    required = set(periodic_task.upstream_tasks.values_list("name", flat=True))
+    succeeded = set(
+        DBTLogs.objects.filter(
+            pipeline_run_id=pipeline_run_id,
+            periodic_task_name__in=required,
+            success=True,
+            parent__isnull=True,
+        ).values_list("periodic_task_name", flat=True)
+    )
+    last_started = (
+        DBTLogs.objects.filter(pk=periodic_task.last_dbt_log_id)
+        .values_list("created_at", flat=True)
+        .first()
+    )
+    waiting = []
+    for name in sorted(required - succeeded):
+        latest = (
+            DBTLogs.objects.summary()
+            .filter(periodic_task_name=name, parent__isnull=True, completed_at__isnull=False)
+            .order_by("-id")
+            .first()
+        )
+        if (
+            latest is None
+            or not latest.success
+            or (last_started is not None and latest.completed_at <= last_started)
+        ):
+            waiting.append(name)
+    return waiting
+
+
+def dispatch_downstream_tasks(periodic_task, pipeline_run_id):
+    """Start the downstream tasks of ``periodic_task`` that are now unblocked.
+
+    Upstream tasks finishing at the same time may both find a downstream task
+    ready; the PipelineDispatch row makes sure only one of them starts it.
+    Returns the tasks started.
+    """
+    from config.celery_app import dbt_runner_task
+
+    started = []
+    for downstream in periodic_task.downstream_tasks.filter(enabled=True):
+        waiting = waiting_for(downstream, pipeline_run_id)
+        if waiting:
+            print(f"Pipeline {pipeline_run_id}: {downstream.name} waits for {', '.join(waiting)}")
+            continue
+        try:
+            with transaction.atomic():
+                PipelineDispatch.objects.create(
+                    pipeline_run_id=pipeline_run_id, periodic_task=downstream
+                )
+        except IntegrityError:
+            continue
+        dbt_runner_task.apply_async(
+            args=json.loads(downstream.args or "[]"),
+            kwargs={"task_id": downstream.id, "pipeline_run_id": pipeline_run_id},
+            queue=downstream.queue or None,
+            priority=downstream.priority,
+        )
+        print(f"Pipeline {pipeline_run_id}: started {downstream.name}")
+        started.append(downstream)
+    return started
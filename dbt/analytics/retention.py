@@ -0,0 +1,200 @@
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, ProtectedError
+from django.utils import timezone
+
+from dbt.analytics.models import (
+    ArtifactBlob,
+    DBTLogChunk,
+    DBTLogs,
+    GitRepo,
+    PeriodicTask,
+)
+from dbt.utils.archive import (
+    STDOUT_ARCHIVE_NAME,
+    archive_dir,
+    archive_file_exists,
+    blob_archive_dir,
+    blob_archive_name,
+    write_archive_file,
+)
+from dbt.utils.artifacts import ARTIFACT_NAMES
+
+# what an archived log keeps of its heavy columns
+CLEARED_FIELDS = {
+    **{name: None for name in ARTIFACT_NAMES},
+    **{f"{name}_blob": None for name in ARTIFACT_NAMES},
+    "dbt_stdout": None,
+}
+
+
+def keep_full_runs(periodic_task_name, policies):
+    periodic_task = policies.get(periodic_task_name)
+    if periodic_task is not None and periodic_task.keep_full_runs is not None:
+        return periodic_task.keep_full_runs
+    return getattr(settings, "DBT_RETENTION_KEEP_FULL_RUNS")
+
+
+def protected_log_ids(task_names):
+    """Logs later runs read artifacts from: the manifest to compare and shard
+    against, and the sources.json new data is detected with."""
+    protected = set()
+    for name in task_names:
+        last_success = DBTLogs.objects.last_successful(name)
+        if last_success is not None:
+            protected.add(last_success.id)
+    for repository_name in GitRepo.objects.values_list("name", flat=True):
+        latest_sources = DBTLogs.objects.latest_sources(repository_name)
+        if latest_sources is not None:
+            protected.add(latest_sources.id)
+    return protected
+
+
+def expired_logs(periodic_task_name, keep):
+    """Finished runs of a task older than its newest ``keep``, not yet archived."""
+    queryset = DBTLogs.objects.history(periodic_task_name)
+    if keep > 0:
+        cutoff = queryset.values_list("id", flat=True)[keep - 1 : keep].first()
+        if cutoff is None:
+            return DBTLogs.objects.none()
+        queryset = queryset.filter(id__lt=cutoff)
+    return queryset.filter(archived_at__isnull=True, completed_at__isnull=False).order_by("id")
+
+
+def blob_archived(digest):
+    return archive_file_exists(blob_archive_dir(digest), blob_archive_name(digest))
+
+
+def archive_text(digest, text):
+    write_archive_file(blob_archive_dir(digest), blob_archive_name(digest), [text])
+
+
+def archive_blob(blob_id, digest):
+    """Make sure the content of a blob is in the archive before the blob can go."""
+    if not blob_archived(digest):
+        text = ArtifactBlob.json_text(blob_id)
+        if text is not None:
+            archive_text(digest, text)
+
+
+def archive_dbt_log(dbt_log):
+    """Move the artifacts and output of a log to the archive; False when another
+    process got to it first.
+
+    Artifacts are archived once per blob, under its digest; the output once per log.
+    """
+    blob_ids = {
+        name: getattr(dbt_log, f"{name}_blob_id")
+        for name in ARTIFACT_NAMES
+        if getattr(dbt_log, f"{name}_blob_id") is not None
+    }
+    digests = dict(
+        ArtifactBlob.objects.filter(id__in=blob_ids.values()).values_list("id", "digest")
+    )
+    archived_artifacts = {}
+    for name in ARTIFACT_NAMES:
+        if name in blob_ids:
+            digest = digests.get(blob_ids[name])
+            if digest is None:
+                continue
+            archive_blob(blob_ids[name], digest)
+        else:
+            # inline artifacts of runs from before the blob store
+            text = dbt_log.get_artifact_json(name)
+            if not text:
+                continue
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if not blob_archived(digest):
+                archive_text(digest, text)
+        archived_artifacts[name] = digest
+    relative_dir = archive_dir(dbt_log.id, dbt_log.created_at)
+    write_archive_file(relative_dir, STDOUT_ARCHIVE_NAME, dbt_log.iter_stdout())
+    # the files are complete before the row points at them, and the row is
+    # locked only for this one update
+    with transaction.atomic():
+        archived = DBTLogs.objects.filter(pk=dbt_log.pk, archived_at__isnull=True).update(
+            archived_at=timezone.now(),
+            archive_path=relative_dir,
+            archived_artifacts=archived_artifacts,
+            **CLEARED_FIELDS,
+        )
+        if archived:
+            DBTLogChunk.objects.filter(dbt_log_id=dbt_log.pk).delete()
+    return bool(archived)
+
+
+def orphan_blobs():
+    """Blobs no log points at; every check is a lookup on an indexed foreign key."""
+    blobs = ArtifactBlob.objects.all()
+    for name in ARTIFACT_NAMES:
+        blobs = blobs.filter(
+            ~Exists(DBTLogs.objects.filter(**{f"{name}_blob": OuterRef("pk")}))
+        )
+    return blobs
+
+
+def delete_orphan_blobs(batch_size):
+    """Delete the blobs no log points at anymore, ``batch_size`` at a time."""
+    deleted = 0
+    while True:
+        try:
+            with transaction.atomic():
+                # blobs a run is attaching right now are locked by it and skipped
+                blobs = list(
+                    orphan_blobs()
+                    .select_for_update(skip_locked=True)
+                    .values_list("id", "digest")[:batch_size]
+                )
+                if not blobs:
+                    return deleted
+                # archived logs read the content from the archive from now on
+                for blob_id, digest in blobs:
+                    archive_blob(blob_id, digest)
+                _, counts = ArtifactBlob.objects.filter(
+                    id__in=[blob_id for blob_id, _ in blobs]
+                ).delete()
+        except (IntegrityError, ProtectedError) as err:
+            print(f"Could not delete artifact blobs: {err}")
+            return deleted
+        deleted += counts.get(ArtifactBlob._meta.label, 0)
+
+
+def compact_dbt_logs(batch_size=None, dry_run=False):
+    """Archive the runs every task has beyond its retention, then drop the unused blobs.
+
+    Returns ``(archived logs, deleted blobs)``. Summaries of archived runs stay
+    in DBTLogs; only the artifact and output columns are emptied.
+    """
+    batch_size = batch_size or getattr(settings, "DBT_RETENTION_BATCH_SIZE")
+    policies = {task.name: task for task in PeriodicTask.objects.all()}
+    task_names = set(
+        DBTLogs.objects.filter(parent__isnull=True)
+        .order_by()
+        .values_list("periodic_task_name", flat=True)
+        .distinct()
+    )
+    protected = protected_log_ids(task_names)
+    archived = 0
+    for name in task_names:
+        expired = expired_logs(name, keep_full_runs(name, policies)).exclude(id__in=protected)
+        last_id = 0
+        while True:
+            batch = list(expired.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            # shards are archived with the run they are part of
+            batch += list(
+                DBTLogs.objects.summary().filter(
+                    parent_id__in=[dbt_log.id for dbt_log in batch], archived_at__isnull=True
+                )
+            )
+            if dry_run:
+                archived += len(batch)
+                continue
+            archived += sum(archive_dbt_log(dbt_log) for dbt_log in batch)
+    if dry_run:
+        return archived, orphan_blobs().count()
+    return archived, delete_orphan_blobs(batch_size)
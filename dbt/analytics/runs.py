@@ -0,0 +1,52 @@
+from django.utils import timezone
+
+from dbt.analytics.models import Run
+from dbt.utils.run_status import (
+    RUN_STATUS_CLONING,
+    RUN_STATUS_DONE,
+    RUN_STATUS_INGESTING,
+    RUN_STATUS_PARSING,
+    RUN_STATUS_RUNNING,
+    RunStatus,
+)
+
+# the Run column stamped when a run enters each phase
+PHASE_STARTED_FIELDS = {
+    RUN_STATUS_CLONING: "pull_started_at",
+    RUN_STATUS_PARSING: "parse_started_at",
+    RUN_STATUS_RUNNING: "execute_started_at",
+    RUN_STATUS_INGESTING: "ingest_started_at",
+    RUN_STATUS_DONE: "completed_at",
+}
+
+
+def start_run(run_id, task_id, command, parent_log_id=None):
+    """Record that a worker picked up the run; a retried run keeps its row."""
+    parent = None
+    if parent_log_id is not None:
+        parent = Run.objects.filter(dbt_log_id=parent_log_id).first()
+    run, _ = Run.objects.get_or_create(
+        run_id=run_id,
+        defaults={
+            "periodic_task_id": task_id,
+            "command": command,
+            "parent": parent,
+        },
+    )
+    return run
+
+
+class TrackedRun(RunStatus):
+    """Status of a run that is also saved on its Run row, with the time of each phase."""
+
+    def set(self, status, **fields):
+        super().set(status, **fields)
+        if self.run_id is None:
+            return
+        updates = {"status": status}
+        if status in PHASE_STARTED_FIELDS:
+            updates[PHASE_STARTED_FIELDS[status]] = timezone.now()
+        for name in ("success", "skipped", "dbt_log_id"):
+            if name in fields:
+                updates[name] = fields[name]
+        Run.objects.filter(run_id=self.run_id).update(**updates)
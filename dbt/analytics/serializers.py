@@ -1,39 +1,43 @@
 from django_celery_beat.models import IntervalSchedule, CrontabSchedule
 from rest_framework import serializers
 from timezone_field.rest_framework import TimeZoneSerializerField
-from rest_framework.exceptions import ValidationError
 from dbt.analytics.models import (
+    DBT_LOG_HEAVY_FIELDS,
+    GIT_REPO_STATUS_PENDING,
+    DBTLogs,
     GitRepo,
+    NodeRunResult,
     ProfileYAML,
+    Run,
     SSHKey,
     PeriodicTask as PeriodicTaskModel,
 )
-from dbt.utils.common import clone_git_repo
+from dbt.analytics.pipelines import upstream_cycle
+from config.celery_app import schedule_git_repo_clone
 
 
 class GitRepoSerializer(serializers.ModelSerializer):
     class Meta:
         model = GitRepo
         fields = "__all__"
+        read_only_fields = ("status", "status_message", "progress", "synced_at")
 
     def create(self, validated_data):
         repo = GitRepo.objects.create(**validated_data)
-        result, msg = clone_git_repo(repo)
-        if result:
-            return repo
-        else:
-            # delete the repo from db
-            repo.delete()
-            raise ValidationError(detail=f"Error creating repo: {msg}")
+        schedule_git_repo_clone(repo)
+        return repo
 
     def update(self, instance, validated_data):
-        result, msg = clone_git_repo(validated_data)
-        if result:
-            instance = super().update(instance, validated_data)
-            clone_git_repo(instance)
-            return instance
-        else:
-            raise ValidationError(detail=f"{msg}")
+        validated_data["status"] = GIT_REPO_STATUS_PENDING
+        instance = super().update(instance, validated_data)
+        schedule_git_repo_clone(instance)
+        return instance
+
+
+class GitRepoStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GitRepo
+        fields = ("id", "status", "status_message", "progress", "synced_at")
 
 
 class ProfileYAMLSerializer(serializers.ModelSerializer):
@@ -82,8 +86,21 @@ class WritePeriodicTaskSerializer(serializers.ModelSerializer):
             "args",
             "git_repo",
             "profile_yml",
+            "run_mode",
+            "upstream_tasks",
+            "shards",
+            "when_unchanged",
+            "run_on_new_data",
+            "keep_full_runs",
         )
 
+    def validate_upstream_tasks(self, value):
+        if upstream_cycle(self.instance, value):
+            raise serializers.ValidationError(
+                "A task cannot run after itself, directly or through its upstream tasks."
+            )
+        return value
+
 
 class DBTCurrentVersionSerializer(serializers.Serializer):
     module_name = serializers.CharField()
@@ -104,3 +121,21 @@ class RunTaskSerializer(serializers.Serializer):
         ret['args'] = task.args
         return ret
 
+
+
+class NodeRunResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NodeRunResult
+        fields = "__all__"
+
+
+class RunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Run
+        fields = "__all__"
+
+
+class DBTLogsSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DBTLogs
+        exclude = DBT_LOG_HEAVY_FIELDS
@@ -0,0 +1,130 @@
+import json
+import tempfile
+
+from celery import chord
+from django.db.models import Max
+
+from dbt.analytics.ingestion import (
+    load_run_results,
+    save_args,
+    save_artifact,
+    save_node_results,
+)
+from dbt.analytics.models import DBTLogs, NodeRunResult, PeriodicTask
+from dbt.analytics.pipelines import dispatch_downstream_tasks
+from dbt.analytics.runs import TrackedRun
+from dbt.utils.artifacts import artifact_path
+from dbt.utils.run_status import RUN_STATUS_DONE
+from dbt.utils.sharding import (
+    SHARD_RESOURCE_TYPES,
+    connected_components,
+    manifest_graph,
+    pack_shards,
+    shard_command,
+    shardable_args,
+)
+from dbt.utils.state import write_state_manifest
+
+
+def plan_shards(periodic_task, dbt_command):
+    """Split ``dbt_command`` into one command per shard, or None when it cannot be split.
+
+    The DAG comes from the manifest of the task's last successful run and the
+    weight of each node from its recent execution times.
+    """
+    args = shardable_args(dbt_command)
+    if args is None:
+        return None
+    last_success = DBTLogs.objects.last_successful(periodic_task.name)
+    manifest_json = last_success.get_artifact_json("manifest") if last_success else None
+    if not manifest_json:
+        return None
+    with tempfile.TemporaryDirectory() as state_dir:
+        write_state_manifest(manifest_json, state_dir)
+        selectors, edges = manifest_graph(
+            artifact_path(state_dir, "manifest"), SHARD_RESOURCE_TYPES[args[0]]
+        )
+    components = connected_components(selectors, edges)
+    durations = NodeRunResult.objects.average_execution_times(list(selectors))
+    shards = pack_shards(components, durations, periodic_task.shards)
+    if len(shards) < 2:
+        return None
+    return [
+        shard_command(args, sorted(selectors[node] for node in nodes)) for nodes in shards
+    ]
+
+
+def dispatch_shards(periodic_task, dbt_log, commands, commit, pipeline_run_id):
+    """Run every shard as its own task, merging them into ``dbt_log`` when all are done."""
+    from config.celery_app import dbt_runner_task, merge_dbt_shards_task
+
+    header = [
+        dbt_runner_task.signature(
+            args=[command],
+            kwargs={
+                "task_id": periodic_task.id,
+                "pipeline_run_id": pipeline_run_id,
+                "parent_log_id": dbt_log.id,
+                "commit": commit,
+            },
+            queue=periodic_task.queue or None,
+            priority=periodic_task.priority,
+            immutable=True,
+        )
+        for command in commands
+    ]
+    chord(header)(merge_dbt_shards_task.si(dbt_log.id))
+
+
+def merge_run_results(shard_logs):
+    """One run_results document out of the run_results of every shard."""
+    merged = None
+    for shard_log in shard_logs:
+        text = shard_log.get_artifact_json("run_results")
+        if not text:
+            continue
+        run_results = json.loads(text)
+        if merged is None:
+            merged = run_results
+            continue
+        merged["results"].extend(run_results.get("results") or [])
+        merged["elapsed_time"] = max(
+            merged.get("elapsed_time") or 0, run_results.get("elapsed_time") or 0
+        )
+    return merged
+
+
+def merge_shards(dbt_log):
+    """Fill the run a set of shards belonged to with their combined results."""
+    shard_logs = list(dbt_log.shard_logs.summary().order_by("id"))
+    failed = [shard_log for shard_log in shard_logs if not shard_log.success]
+    run_results = merge_run_results(shard_logs)
+    if run_results is not None:
+        with tempfile.TemporaryDirectory() as target_dir:
+            with open(artifact_path(target_dir, "run_results"), "w", encoding="utf-8") as file:
+                json.dump(run_results, file)
+            save_artifact(dbt_log, "run_results", artifact_path(target_dir, "run_results"))
+            shard_results = load_run_results(target_dir)
+            save_args(dbt_log, shard_results)
+            save_node_results(dbt_log, shard_results)
+    # every shard parsed the same commit, so their manifests are the same
+    manifest_log = next((log for log in shard_logs if log.manifest_blob_id), None)
+    DBTLogs.objects.filter(pk=dbt_log.pk).update(
+        manifest_blob_id=manifest_log.manifest_blob_id if manifest_log else None,
+        completed_at=dbt_log.shard_logs.aggregate(Max("completed_at"))["completed_at__max"],
+        success=bool(shard_logs) and not failed,
+        fail_reason="\n".join(
+            f"shard {shard_log.id}: {shard_log.fail_reason}" for shard_log in failed
+        )
+        or None,
+        dbt_stdout="\n".join(
+            f"shard {shard_log.id} ({'ok' if shard_log.success else 'failed'}): {shard_log.command}"
+            for shard_log in shard_logs
+        ),
+    )
+    TrackedRun(dbt_log.run_id).set(RUN_STATUS_DONE, success=bool(shard_logs) and not failed)
+    if shard_logs and not failed:
+        periodic_task = PeriodicTask.objects.filter(name=dbt_log.periodic_task_name).first()
+        if periodic_task is not None:
+            dispatch_downstream_tasks(periodic_task, dbt_log.pipeline_run_id)
+    return len(shard_logs)
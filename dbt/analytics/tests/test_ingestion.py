@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from django.db import connection
+
+from dbt.analytics.ingestion import ingest_artifacts
+from dbt.analytics.models import ArtifactBlob, DBTLogs
+
+pytestmark = [
+    pytest.mark.skipif(
+        connection.vendor != "postgresql", reason="artifacts are streamed with COPY on PostgreSQL only"
+    ),
+    pytest.mark.django_db(transaction=True),
+]
+
+
+def write_artifacts(target_dir, run):
+    """Write the four artifacts of a run; text that COPY would otherwise read as
+    quotes, escapes or row separators is part of each of them."""
+    artifacts = {
+        "manifest": {
+            "nodes": {
+                "model.shop.orders": {
+                    "resource_type": "model",
+                    "name": "orders",
+                    "fqn": ["shop", "orders"],
+                    "depends_on": {"nodes": ["source.shop.raw.orders"]},
+                    "raw_code": 'select "id",\n\t\'a\\b\' from raw',
+                }
+            },
+            "sources": {
+                "source.shop.raw.orders": {"resource_type": "source", "name": "orders", "fqn": ["shop", "raw"]}
+            },
+        },
+        "run_results": {
+            "results": [
+                {
+                    "unique_id": "model.shop.orders",
+                    "status": "success",
+                    "execution_time": 1.5,
+                    "message": f"SELECT {run}",
+                    "adapter_response": {"rows_affected": run},
+                    "timing": [],
+                }
+            ],
+            "args": {"which": "run"},
+        },
+        "sources": {
+            "results": [
+                {"unique_id": "source.shop.raw.orders", "status": "pass", "max_loaded_at": f"2026-10-0{run}T00:00:00"}
+            ]
+        },
+        "catalog": {"nodes": {}, "sources": {}, "errors": None},
+    }
+    for name, content in artifacts.items():
+        (target_dir / f"{name}.json").write_text(json.dumps(content))
+    return artifacts
+
+
+def test_ingest_artifacts_streams_every_artifact_of_a_run(settings, tmp_path):
+    settings.DBT_ARTIFACT_STORAGE = "jsonb"
+    artifacts = write_artifacts(tmp_path, run=1)
+    dbt_log = DBTLogs.objects.create(command="dbt run")
+
+    ingest_artifacts(dbt_log, str(tmp_path))
+
+    dbt_log.refresh_from_db()
+    for name, content in artifacts.items():
+        blob = getattr(dbt_log, f"{name}_blob")
+        assert blob is not None, name
+        assert blob.content == content, name
+    assert dbt_log.node_results.count() == 1
+
+
+def test_ingest_artifacts_reuses_unchanged_blobs(settings, tmp_path):
+    settings.DBT_ARTIFACT_STORAGE = "jsonb"
+    write_artifacts(tmp_path, run=1)
+    first = DBTLogs.objects.create(command="dbt run")
+    ingest_artifacts(first, str(tmp_path))
+    artifacts = write_artifacts(tmp_path, run=2)
+    second = DBTLogs.objects.create(command="dbt run")
+
+    ingest_artifacts(second, str(tmp_path))
+
+    first.refresh_from_db()
+    second.refresh_from_db()
+    # manifest and catalog did not change, run_results and sources did
+    assert second.manifest_blob_id == first.manifest_blob_id
+    assert second.catalog_blob_id == first.catalog_blob_id
+    assert second.run_results_blob_id != first.run_results_blob_id
+    assert second.sources_blob_id != first.sources_blob_id
+    assert second.run_results_blob.content == artifacts["run_results"]
+    assert second.sources_blob.content == artifacts["sources"]
+    assert ArtifactBlob.objects.count() == 6
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from redis import RedisError
+
+from dbt.analytics.models import PeriodicTask
+from dbt.utils.git import resolve_commit
+from dbt.utils.run_status import RUN_STATUS_QUEUED, RunStatus
+from dbt.utils.slots import get_redis
+
+# deletes the key only while it still belongs to the given run
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def trigger_key(periodic_task, args):
+    """Identify a run by its task, arguments and the commit it would check out."""
+    commit = None
+    if periodic_task.git_repo is not None:
+        commit = resolve_commit(periodic_task.git_repo)
+    payload = json.dumps([periodic_task.id, list(args), commit or "unknown"])
+    return "dbt:trigger:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def claim_trigger(key, celery_task_id):
+    """Return the celery task id the run belongs to, ``celery_task_id`` when it is new."""
+    client = get_redis()
+    expires = getattr(settings, "DBT_TRIGGER_DEDUP_SECONDS")
+    if client.set(key, celery_task_id, nx=True, ex=expires):
+        return celery_task_id
+    owner = client.get(key)
+    return owner.decode("utf-8") if owner else celery_task_id
+
+
+def claim_run(celery_task_id, args, task_kwargs):
+    """Claim the run a dbt_runner_task is about to start; returns ``(key, owner)``.
+
+    ``owner`` is another celery task id when the same run is already queued or
+    going on. ``key`` is None when runs of this task are not deduplicated.
+    """
+    if task_kwargs.get("parent_log_id"):
+        # shards are started once by their parent run
+        return None, celery_task_id
+    try:
+        key = task_kwargs.get("trigger_key")
+        if key is None:
+            periodic_task = (
+                PeriodicTask.objects.select_related("git_repo")
+                .filter(id=task_kwargs.get("task_id"))
+                .first()
+            )
+            if periodic_task is None:
+                return None, celery_task_id
+            key = trigger_key(periodic_task, args)
+        return key, claim_trigger(key, celery_task_id)
+    except RedisError as err:
+        print(f"Trigger deduplication unavailable: {err}")
+        return None, celery_task_id
+
+
+def release_trigger(key, celery_task_id):
+    try:
+        get_redis().eval(RELEASE_SCRIPT, 1, key, celery_task_id)
+    except RedisError as err:
+        print(f"Could not release {key}: {err}")
+
+
+def trigger_periodic_task(periodic_task, triggered_by="api"):
+    """Queue a run of ``periodic_task`` unless the same run is already queued or running.
+
+    ``triggered_by`` tells the run it was not started by the task's schedule.
+    Returns ``(celery task id, created)``; a duplicate trigger gets the id of the
+    run it was folded into.
+    """
+    from config.celery_app import dbt_runner_task
+
+    args = json.loads(periodic_task.args) if periodic_task.args else []
+    kwargs = json.loads(periodic_task.kwargs) if periodic_task.kwargs else {}
+    kwargs["triggered_by"] = triggered_by
+    celery_task_id = str(uuid.uuid4())
+    try:
+        key = trigger_key(periodic_task, args)
+        owner = claim_trigger(key, celery_task_id)
+    except RedisError as err:
+        print(f"Trigger deduplication unavailable: {err}")
+        key, owner = None, celery_task_id
+    if owner != celery_task_id:
+        return owner, False
+    if key is not None:
+        kwargs["trigger_key"] = key
+    RunStatus(celery_task_id).set(RUN_STATUS_QUEUED, task_id=periodic_task.id)
+    dbt_runner_task.apply_async(args=args, kwargs=kwargs, task_id=celery_task_id)
+    return celery_task_id, True
@@ -1,18 +1,34 @@
 from django_celery_beat.models import IntervalSchedule, CrontabSchedule
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.decorators import action
+from django.utils.decorators import method_decorator
+import json
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from redis import RedisError
+from dbt.utils.artifacts import ARTIFACT_NAMES
+from dbt.utils.run_status import RUN_STATUS_DONE, RunStatus
 from dbt.utils.common import load_dbt_current_version
-from config.celery_app import dbt_runner_task
+from dbt.analytics.lineage import lineage_manifest_log, load_lineage
+from dbt.analytics.triggers import trigger_periodic_task
+from dbt.utils.lineage import LINEAGE_DIRECTIONS
 from dbt.analytics.models import (
+    DBTLogs,
     GitRepo,
+    NodeRunResult,
     ProfileYAML,
+    Run,
     SSHKey,
     PeriodicTask as PeriodicTaskModel,
 )
 from dbt.analytics.serializers import (
     GitRepoSerializer,
+    GitRepoStatusSerializer,
     IntervalScheduleSerializer,
     PeriodicTaskSerializer,
     ProfileYAMLSerializer,
@@ -21,14 +37,62 @@ from dbt.analytics.serializers import (
     CrontabScheduleSerializer,
     DBTCurrentVersionSerializer,
     RunTaskSerializer,
+    NodeRunResultSerializer,
+    DBTLogsSummarySerializer,
+    RunSerializer,
 )
 
 
+STDOUT_CHUNKS_PER_PAGE = 100
+RUN_HISTORY_PAGE_SIZE = 50
+RUN_HISTORY_MAX_PAGE_SIZE = 500
+
+
+def logged_run_status(run_id):
+    """The status of a run from its Run row, once Redis no longer knows it."""
+    run = (
+        Run.objects.filter(run_id=run_id)
+        .values("run_id", "status", "success", "skipped", "dbt_log_id", "periodic_task_id")
+        .first()
+    )
+    if run is None:
+        return None
+    run["task_id"] = run.pop("periodic_task_id")
+    run["version"] = 0
+    return run
+
+
+def run_status(run_id, version=None, wait=0):
+    """The status of a run, waiting up to ``wait`` seconds for one newer than ``version``."""
+    run = RunStatus(run_id)
+    try:
+        if version is not None and wait > 0:
+            # no connection is held while waiting on Redis
+            connection.close()
+            status = run.wait(version, wait)
+        else:
+            status = run.get()
+    except RedisError as err:
+        print(f"Run status unavailable: {err}")
+        status = None
+    return status or logged_run_status(run_id)
+
+
 class GitRepoAPIViewset(ModelViewSet):
     http_method_names = ["get", "post", "delete", "head", "options", "trace"]
     queryset = GitRepo.objects.all()
     serializer_class = GitRepoSerializer
 
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="status",
+        serializer_class=GitRepoStatusSerializer,
+    )
+    def clone_status(self, request, pk=None):
+        """Clone status and progress of the repo."""
+        return Response(GitRepoStatusSerializer(self.get_object()).data)
+
 
 class PostYMALDetailsView(ModelViewSet):
     serializer_class = ProfileYAMLSerializer
@@ -61,6 +125,108 @@ class AddPeriodicTask(ModelViewSet):
         else:
             return PeriodicTaskSerializer
 
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        """Runs of the task, newest first; pass ``next`` back as ``?before=`` for the next page."""
+        task = self.get_object()
+        before = request.query_params.get("before", "")
+        before = int(before) if before.isdigit() else None
+        limit = request.query_params.get("limit", "")
+        limit = min(int(limit), RUN_HISTORY_MAX_PAGE_SIZE) if limit.isdigit() else None
+        limit = limit or RUN_HISTORY_PAGE_SIZE
+        dbt_logs = list(DBTLogs.objects.history(task.name, before=before)[:limit])
+        return Response(
+            {
+                "results": DBTLogsSummarySerializer(dbt_logs, many=True).data,
+                "next": dbt_logs[-1].id if len(dbt_logs) == limit else None,
+            }
+        )
+
+    @action(detail=True, methods=["get"], url_path="last-run")
+    def last_run(self, request, pk=None):
+        """The latest run of the task, without scanning its history."""
+        task = self.get_object()
+        dbt_log = DBTLogs.objects.summary().filter(pk=task.last_dbt_log_id).first()
+        if dbt_log is None:
+            raise Http404
+        return Response(DBTLogsSummarySerializer(dbt_log).data)
+
+
+class NodeRunResultViewSet(ReadOnlyModelViewSet):
+    """Per-node results, e.g. ``?unique_id=model.project.orders&days=30``."""
+
+    serializer_class = NodeRunResultSerializer
+
+    def get_queryset(self):
+        unique_id = self.request.query_params.get("unique_id")
+        days = self.request.query_params.get("days")
+        if unique_id:
+            return NodeRunResult.objects.for_node(
+                unique_id, days=int(days) if days and days.isdigit() else None
+            )
+        return NodeRunResult.objects.order_by("-created_at")
+
+
+class DBTLogsViewSet(ReadOnlyModelViewSet):
+    """Log summaries; artifacts are fetched one at a time from ``artifacts/<name>/``."""
+
+    queryset = DBTLogs.objects.summary().order_by("-id")
+    serializer_class = DBTLogsSummarySerializer
+
+    @action(detail=True, methods=["get"], url_path=r"artifacts/(?P<name>\w+)")
+    def artifact(self, request, pk=None, name=None):
+        if name not in ARTIFACT_NAMES:
+            raise Http404
+        dbt_log = self.get_object()
+        return HttpResponse(
+            dbt_log.get_artifact_json(name) or "null", content_type="application/json"
+        )
+
+    @action(detail=True, methods=["get"])
+    def stdout(self, request, pk=None):
+        """Tail the dbt output: pass the last seen ``seq`` as ``?after=``."""
+        dbt_log = self.get_object()
+        after = request.query_params.get("after", "")
+        after = int(after) if after.isdigit() else None
+        chunks = dbt_log.stdout_chunks.order_by("seq")
+        if after is not None:
+            chunks = chunks.filter(seq__gt=after)
+        chunks = list(chunks.values("seq", "content")[:STDOUT_CHUNKS_PER_PAGE])
+        if (
+            not chunks
+            and after is None
+            and dbt_log.completed_at is not None
+            and not dbt_log.stdout_chunks.exists()
+        ):
+            # logged before output was chunked, or its chunks were archived
+            chunks = [{"seq": 0, "content": "".join(dbt_log.iter_stdout())}]
+        return Response(
+            {
+                "chunks": chunks,
+                "next": chunks[-1]["seq"] if chunks else after,
+                "completed": dbt_log.completed_at is not None,
+            }
+        )
+
+
+class RunViewSet(ReadOnlyModelViewSet):
+    """Runs with the time of each phase, e.g. ``?status=running`` or ``?active=true``."""
+
+    serializer_class = RunSerializer
+    lookup_field = "run_id"
+
+    def get_queryset(self):
+        queryset = Run.objects.order_by("-created_at")
+        run_status_param = self.request.query_params.get("status")
+        if run_status_param:
+            queryset = queryset.filter(status=run_status_param)
+        if self.request.query_params.get("active") == "true":
+            queryset = queryset.exclude(status=RUN_STATUS_DONE)
+        task_id = self.request.query_params.get("task_id", "")
+        if task_id.isdigit():
+            queryset = queryset.filter(periodic_task_id=int(task_id))
+        return queryset
+
 
 class DBTCurrentVersionView(APIView):
     def get(self, request,):
@@ -78,12 +244,122 @@ class RunDBTTask(APIView):
         if serializer.is_valid():
             task_id = serializer.validated_data["task_id"]
             task = PeriodicTaskModel.objects.get(id=task_id)
-            args = eval(task.args) if task.args else []
-            kwargs = eval(task.kwargs) if task.kwargs else {}
-            dbt_runner_task.delay(*args, **kwargs)
+            # triggering a run that is already queued or going on returns that run
+            celery_task_id, created = trigger_periodic_task(task)
             return Response(
-                {"status": "Task has been initiated"}, status=status.HTTP_200_OK
+                {
+                    "status": "Task has been initiated"
+                    if created
+                    else "Task is already queued or running",
+                    "celery_task_id": celery_task_id,
+                    # follow the run at runs/<run_id>/status
+                    "run_id": celery_task_id,
+                    "created": created,
+                },
+                status=status.HTTP_200_OK,
             )
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+
+# a request waits for minutes, it must not hold a transaction meanwhile
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class RunStatusView(APIView):
+    """Status of a run; ``?version=<last seen>&wait=<seconds>`` waits for the next change."""
+
+    def get(self, request, run_id):
+        version = request.query_params.get("version", "")
+        wait = request.query_params.get("wait", "")
+        status_data = run_status(
+            run_id,
+            version=int(version) if version.isdigit() else None,
+            wait=min(
+                int(wait) if wait.isdigit() else 0,
+                getattr(settings, "DBT_RUN_STATUS_MAX_WAIT_SECONDS"),
+            ),
+        )
+        if status_data is None:
+            raise Http404
+        return Response(status_data)
+
+
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class RunEventsView(APIView):
+    """Server-sent events with the status of a run, until it is done."""
+
+    def get(self, request, run_id):
+        if run_status(run_id) is None:
+            raise Http404
+        max_wait = getattr(settings, "DBT_RUN_STATUS_MAX_WAIT_SECONDS")
+
+        def events():
+            version = -1
+            deadline = time.monotonic() + max_wait
+            while True:
+                status_data = run_status(
+                    run_id, version=version, wait=max(deadline - time.monotonic(), 0)
+                )
+                if status_data is None:
+                    return
+                if status_data["version"] != version:
+                    version = status_data["version"]
+                    yield f"data: {json.dumps(status_data)}\n\n"
+                if status_data["status"] == RUN_STATUS_DONE or time.monotonic() >= deadline:
+                    return
+                if status_data["version"] == 0:
+                    # only the log knows this run, nothing will be published
+                    return
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class LineageView(APIView):
+    """Nodes up- or downstream of ``unique_id``.
+
+    One of ``?dbt_log=<id>``, ``?task_id=<id>`` or ``?repository=<name>``
+    picks the manifest, ``?depth=1`` stops at the direct parents or children
+    and ``?resource_type=model,source`` filters the nodes returned.
+    """
+
+    def get(self, request, unique_id, direction):
+        if direction not in LINEAGE_DIRECTIONS:
+            raise Http404
+        params = request.query_params
+        dbt_log_id = params.get("dbt_log", "")
+        task_id = params.get("task_id", "")
+        depth = params.get("depth", "")
+        try:
+            dbt_log = lineage_manifest_log(
+                dbt_log_id=int(dbt_log_id) if dbt_log_id.isdigit() else None,
+                task_id=int(task_id) if task_id.isdigit() else None,
+                repository=params.get("repository") or None,
+            )
+        except ValueError as err:
+            return Response({"detail": str(err)}, status=status.HTTP_400_BAD_REQUEST)
+        graph = load_lineage(dbt_log.manifest_blob_id) if dbt_log is not None else None
+        if graph is None:
+            return Response({"detail": "No manifest found"}, status=status.HTTP_404_NOT_FOUND)
+        found = graph.walk(unique_id, direction, int(depth) if depth.isdigit() else None)
+        if found is None:
+            return Response(
+                {"detail": f"{unique_id} is not in the manifest"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        resource_types = [name for name in params.get("resource_type", "").split(",") if name]
+        if resource_types:
+            # dbt unique ids start with the resource type, e.g. model.project.orders
+            found = [node for node in found if node[0].split(".", 1)[0] in resource_types]
+        return Response(
+            {
+                "unique_id": unique_id,
+                "direction": direction,
+                "dbt_log_id": dbt_log.id,
+                "nodes": [
+                    {"unique_id": node_id, "depth": node_depth} for node_id, node_depth in found
+                ],
+            }
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from dbt.analytics.retention import compact_dbt_logs
+
+
+class Command(BaseCommand):
+    help = "Archive the artifacts and output of runs beyond each task's retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", action="store", type=int, default=None)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        archived, deleted = compact_dbt_logs(
+            batch_size=options["batch_size"], dry_run=options["dry_run"]
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"Would archive {archived} logs, {deleted} blobs are unused")
+            return
+        self.stdout.write(f"Archived {archived} logs and deleted {deleted} unused blobs")
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from dbt.analytics.models import ArtifactBlob
+from dbt.utils.compression import compress_text
+
+
+class Command(BaseCommand):
+    help = "Store the artifact blobs still kept as jsonb as zstd frames"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", action="store", type=int, default=None)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or getattr(settings, "DBT_RETENTION_BATCH_SIZE")
+        level = getattr(settings, "DBT_ARTIFACT_ZSTD_LEVEL")
+        blobs = ArtifactBlob.objects.filter(compressed__isnull=True, content__isnull=False)
+        compressed = 0
+        last_id = 0
+        while True:
+            batch = list(
+                blobs.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+            # one blob at a time, so only a single artifact is in memory
+            for blob_id in batch:
+                text = (
+                    ArtifactBlob.objects.filter(pk=blob_id)
+                    .annotate(json_text=Cast("content", output_field=TextField()))
+                    .values_list("json_text", flat=True)
+                    .first()
+                )
+                if text is None:
+                    continue
+                compressed += blobs.filter(pk=blob_id).update(
+                    compressed=compress_text(text, level), content=None
+                )
+        self.stdout.write(f"Compressed {compressed} artifact blobs")
@@ -1,21 +1,49 @@
+import hashlib
 import json
 import os
 import subprocess
+import uuid
 from datetime import datetime
 from django.conf import settings
 from django.core.management.base import BaseCommand
-import paramiko
+from dbt.analytics.freshness import upstream_loaded_at
+from dbt.analytics.ingestion import StdoutChunkWriter, ingest_artifacts
+from dbt.analytics.pipelines import dispatch_downstream_tasks
+from dbt.analytics.runs import TrackedRun, start_run
+from dbt.analytics.shards import dispatch_shards, plan_shards
 from dbt.analytics.models import (
-    Args,
+    RUN_MODE_DEFER,
+    RUN_MODE_FULL,
+    RUN_MODE_STATE_MODIFIED,
+    WHEN_UNCHANGED_RUN,
+    WHEN_UNCHANGED_SKIP,
     DBTLogs,
     GitRepo,
     SubProcessLog,
     ProfileYAML,
     PeriodicTask,
 )
-from dbt.utils.common import save_profile_yml
+from dbt.utils.common import load_dbt_core_version
+from dbt.utils.executor import ExecutorUnavailable, executor_args, executor_pool
+from dbt.utils.parse_cache import (
+    parse_cache_dir,
+    profile_hash,
+    restore_parse_state,
+    save_parse_state,
+)
+from dbt.utils.run_status import (
+    PARSED_RE,
+    RUN_STATUS_CLONING,
+    RUN_STATUS_DONE,
+    RUN_STATUS_INGESTING,
+    RUN_STATUS_PARSING,
+    RUN_STATUS_RUNNING,
+)
+from dbt.utils.state import add_state_args, dbt_subcommands, write_state_manifest
+from dbt.utils.workspace import RunWorkspace
 
-SSH_KEY_PREFIX = "git-django_"
+# what a run is downgraded to when nothing changed since the last successful one
+FRESHNESS_COMMAND = "dbt source freshness"
 
 
 class Command(BaseCommand):
@@ -28,162 +56,270 @@ class Command(BaseCommand):
             "--pk", action="store", type=str
         )  # pk is git repo object id
 
-    def read_json(self, filename, pk):
-        DBT_LOG_TARGET = "{}-{}/target".format(
-            getattr(settings, "EXTERNAL_REPO_PREFIX"), pk
+    def compare_to_last_success(self, instance, dbt_log, workspace, dbt_command):
+        """Add --state (and the selection or --defer of the task's run mode) to the command.
+
+        The state is the manifest of the task's last successful run; without
+        one the command runs in full.
+        """
+        last_success = DBTLogs.objects.last_successful(instance.name)
+        manifest_json = last_success.get_artifact_json("manifest") if last_success else None
+        if not manifest_json:
+            print("No successful run to compare to, running in full")
+            return dbt_command
+        state_dir = os.path.join(workspace.path, ".dbt_state")
+        write_state_manifest(manifest_json, state_dir)
+        dbt_command = add_state_args(
+            dbt_command,
+            state_dir,
+            select_modified=instance.run_mode == RUN_MODE_STATE_MODIFIED,
+            defer=instance.run_mode == RUN_MODE_DEFER,
+        )
+        DBTLogs.objects.filter(pk=dbt_log.pk).update(executed_command=dbt_command)
+        print(f"Comparing to the run of {last_success.created_at}: {dbt_command}")
+        return dbt_command
+
+    def run_dbt(self, dbt_command, workspace, profile_yml, stdout, status):
+        """Run the command in the workspace, persisting its output; returns the exit code."""
+
+        def on_line(line):
+            print(line, end="")
+            stdout.write(line)
+            if status.status == RUN_STATUS_PARSING and PARSED_RE.search(line):
+                status.set(RUN_STATUS_RUNNING)
+
+        args = executor_args(dbt_command)
+        if getattr(settings, "DBT_EXECUTION_BACKEND") == "executor" and args is not None:
+            try:
+                with executor_pool.acquire(profile_yml) as executor:
+                    result = executor.run(
+                        args,
+                        cwd=workspace.path,
+                        env={"DBT_PROFILES_DIR": workspace.profiles_dir},
+                        on_line=on_line,
+                    )
+            except ExecutorUnavailable as err:
+                print(f"dbt executor unavailable, starting dbt instead: {err}")
+            else:
+                if result.get("exception"):
+                    on_line(f"{result['exception']}\n")
+                # the exit codes of the dbt CLI
+                if result.get("success"):
+                    return 0
+                return 2 if result.get("exception") else 1
+
+        dbt_result = subprocess.Popen(
+            dbt_command,
+            cwd=workspace.path,
+            env=workspace.env(),
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
         )
-        file_path = os.path.join(DBT_LOG_TARGET, filename)
-        data = {}
         try:
-            with open(file_path, "r") as state:
-                data = json.load(state)
-        except Exception:
-            print(f"{file_path} not found")
-            data = {}
-        return data
+            # Persist the real-time output from stdout in chunks
+            for line in dbt_result.stdout:
+                on_line(line.decode("utf-8", errors="replace"))
+            return dbt_result.wait()
+        finally:
+            dbt_result.kill()
 
     def handle(self, *args, **options):
         os.environ["PATH"] += os.pathsep + "/usr/bin"
         os.environ["PATH"] += os.pathsep + "/bin"
 
-        stdout_data = ""
+        dbt_log = None
+        stdout = None
+        workspace = None
+        status = None
         try:
             dbt_command = options["dbt_command"]
-            pk = json.loads(options["pk"].replace("'", '"'))["task_id"]
+            task_kwargs = json.loads(options["pk"].replace("'", '"'))
+            pk = task_kwargs["task_id"]
+            # the first task of a pipeline starts a new pipeline run
+            pipeline_run_id = task_kwargs.get("pipeline_run_id") or uuid.uuid4().hex
+            # set when this run is one shard of a larger run
+            parent_log_id = task_kwargs.get("parent_log_id")
+            # the celery task id the trigger endpoint handed out, a new one
+            # when started from the command line
+            run_id = task_kwargs.get("run_id") or uuid.uuid4().hex
+            start_run(run_id, pk, dbt_command, parent_log_id)
+            status = TrackedRun(run_id)
 
             if dbt_command.startswith("dbt"):
                 instance = PeriodicTask.objects.get(id=pk)
+                if (
+                    "pipeline_run_id" not in task_kwargs
+                    and "triggered_by" not in task_kwargs
+                    and instance.upstream_tasks.exists()
+                ):
+                    print(f"{instance.name} runs after its upstream tasks, not on its own schedule")
+                    status.set(RUN_STATUS_DONE, skipped=True)
+                    return
+                if (
+                    instance.run_on_new_data
+                    and "triggered_by" not in task_kwargs
+                    and "pipeline_run_id" not in task_kwargs
+                ):
+                    print(f"{instance.name} runs on new source data, not on its own schedule")
+                    status.set(RUN_STATUS_DONE, skipped=True)
+                    return
                 git_repo = GitRepo.objects.get(id=instance.git_repo_id)
                 profile_yml = ProfileYAML.objects.get(id=instance.profile_yml_id)
 
-                EXTERNAL_REPO_PREFIX = getattr(settings, "EXTERNAL_REPO_PREFIX")
-                THIS_PROJECT_PATH = getattr(settings, "THIS_PROJECT_PATH")
-                EXTERNAL_REPO_NAME = f"{EXTERNAL_REPO_PREFIX}-{instance.git_repo_id}"
-                EXTERNAL_REPO_PATH = os.path.join(THIS_PROJECT_PATH, EXTERNAL_REPO_NAME)
-
-                os.path.join(THIS_PROJECT_PATH, EXTERNAL_REPO_NAME)
-                pull_cmd = f"cd {EXTERNAL_REPO_PATH} && git pull origin HEAD"
-                print(f"Pull cmd: {pull_cmd}")
+                # the log exists for the whole run so its output can be followed live
+                dbt_log = DBTLogs.objects.create_for_task(
+                    instance,
+                    command=dbt_command,
+                    repository_used_name=git_repo.name,
+                    profile_yml_used_name=profile_yml.name,
+                    run_id=run_id,
+                    pipeline_run_id=pipeline_run_id,
+                    parent_id=parent_log_id,
+                )
+                stdout = StdoutChunkWriter(dbt_log)
 
-                profile_yml_content = None
-                if instance.profile_yml:
-                    profile_yml_content = profile_yml.profile_yml
-                    save_profile_yml(profile_yml_content, ".dbt/profiles.yml")
-                else:
+                if not instance.profile_yml:
                     print("No profile yml found")
                     exit(-1)
 
-                if git_repo.url.startswith("git"):
-                    pvt_key = os.path.join(
-                        os.getenv("HOME"),
-                        ".ssh/{}{}".format(SSH_KEY_PREFIX, git_repo.ssh_key.id),
-                    )
-                    cmd = 'eval "$(/usr/bin/ssh-agent -s)" && /usr/bin/ssh-add {} && {}'.format(
-                        pvt_key, pull_cmd
+                # a private worktree at a pinned commit, so runs of the same repo
+                # can go on at the same time
+                workspace = RunWorkspace(git_repo)
+                status.set(RUN_STATUS_CLONING, task_id=instance.id, dbt_log_id=dbt_log.id)
+                # shards run the commit their parent run was planned on
+                result, msg = workspace.fetch(commit=task_kwargs.get("commit"))
+                if not result:
+                    SubProcessLog.objects.create(details=msg)
+                    raise Exception(f"Something is wrong while git cloning {msg}")
+                run_profile_hash = profile_hash(profile_yml.profile_yml)
+                # the same command on the same code, profile and source data
+                # would build the same thing again; the source data is only
+                # looked up for tasks that compare fingerprints
+                loaded_at = []
+                if parent_log_id is None and instance.when_unchanged != WHEN_UNCHANGED_RUN:
+                    loaded_at = sorted(
+                        (source, value.isoformat())
+                        for source, value in upstream_loaded_at(instance).items()
                     )
-                    p1 = subprocess.Popen(
-                        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
-                    )
-                else:
-                    p1 = subprocess.Popen(
-                        pull_cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        shell=True,
-                    )
-                p1.wait()
-                SubProcessLog.objects.create(details=str(p1))
-                p1.kill()
-                del p1
-
-                executable_command = "cd {} && {}".format(
-                    EXTERNAL_REPO_PATH, dbt_command
-                )
-                dbt_result = subprocess.Popen(
-                    executable_command,
-                    cwd=EXTERNAL_REPO_PATH,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
+                fingerprint = hashlib.sha256(
+                    "\n".join(
+                        [dbt_command, workspace.commit, run_profile_hash, json.dumps(loaded_at)]
+                    ).encode("utf-8")
+                ).hexdigest()
+                DBTLogs.objects.filter(pk=dbt_log.pk).update(
+                    commit_sha=workspace.commit,
+                    profile_hash=run_profile_hash,
+                    fingerprint=fingerprint,
                 )
-                # Read the real-time output from stdout and save it to a variable
-                for line in dbt_result.stdout:
-                    print(line, end="")
-                    stdout_data += line.decode("utf-8")
 
-                dbt_result.wait()
-                os.system("cd {} && git pull origin HEAD".format(EXTERNAL_REPO_PATH))
+                # decided before anything is checked out
+                if parent_log_id is None and instance.when_unchanged != WHEN_UNCHANGED_RUN:
+                    last_run = DBTLogs.objects.last_run(instance.name)
+                    if last_run and last_run.success and last_run.fingerprint == fingerprint:
+                        message = f"Nothing changed since the run of {last_run.created_at}"
+                        if instance.when_unchanged == WHEN_UNCHANGED_SKIP:
+                            DBTLogs.objects.filter(pk=dbt_log.pk).update(
+                                skipped=True,
+                                success=True,
+                                completed_at=datetime.now(),
+                                dbt_stdout=f"{message}, skipped",
+                            )
+                            dispatch_downstream_tasks(instance, pipeline_run_id)
+                            status.set(RUN_STATUS_DONE, success=True, skipped=True)
+                            return
+                        print(f"{message}, only checking source freshness")
+                        dbt_command = FRESHNESS_COMMAND
+                        DBTLogs.objects.filter(pk=dbt_log.pk).update(
+                            skipped=True, executed_command=dbt_command
+                        )
 
-                manifest = self.read_json(
-                    f"{EXTERNAL_REPO_PATH}/target/manifest.json", instance.git_repo_id
+                result, msg = workspace.checkout(profile_yml.profile_yml)
+                SubProcessLog.objects.create(
+                    details=msg if not result else f"{workspace.path} at {workspace.commit}"
                 )
-                run_results = self.read_json(
-                    f"{EXTERNAL_REPO_PATH}/target/run_results.json",
-                    instance.git_repo_id,
-                )
-                sources = self.read_json(
-                    f"{EXTERNAL_REPO_PATH}/target/sources.json", instance.git_repo_id
+                if not result:
+                    raise Exception(f"Something is wrong while git cloning {msg}")
+
+                if (
+                    parent_log_id is None
+                    and instance.shards > 1
+                    and instance.run_mode == RUN_MODE_FULL
+                ):
+                    shard_commands = plan_shards(instance, dbt_command)
+                    if shard_commands:
+                        # before the shards start, they may all be done before dispatch returns
+                        status.set(RUN_STATUS_RUNNING, shards=len(shard_commands))
+                        dispatch_shards(
+                            instance, dbt_log, shard_commands, workspace.commit, pipeline_run_id
+                        )
+                        stdout.write(f"Split into {len(shard_commands)} shards\n")
+                        stdout.flush()
+                        return
+
+                # start from the parse state of an earlier run so dbt only
+                # re-parses the files that changed
+                parse_cache = parse_cache_dir(
+                    git_repo.id, profile_yml.profile_yml, load_dbt_core_version()
                 )
-                catalog = self.read_json(
-                    f"{EXTERNAL_REPO_PATH}/target/catalog.json", instance.git_repo_id
+                restored = restore_parse_state(
+                    parse_cache, workspace.commit, workspace.target_dir
                 )
+                if restored:
+                    print(f"Restored parse state of {restored}")
 
-                dbt_log = DBTLogs.objects.create(
-                    manifest=manifest,
-                    run_results=run_results,
-                    sources=sources,
-                    catalog=catalog,
-                    command=dbt_command,
-                    repository_used_name=instance.git_repo.name,
-                    profile_yml_used_name=profile_yml.name,
-                    periodic_task_name=instance.name,
-                    completed_at=datetime.now(),
-                    previous_command="this is first commands"
-                    if not DBTLogs.objects.all().exists()
-                    else DBTLogs.objects.last().command,
-                    dbt_stdout=stdout_data,
-                )
+                if instance.run_mode != RUN_MODE_FULL and parent_log_id is None:
+                    dbt_command = self.compare_to_last_success(
+                        instance, dbt_log, workspace, dbt_command
+                    )
 
-                args = run_results.get("args", {})
-                Args.objects.create(
-                    dbt_log=dbt_log,
-                    quiet=args.get("quiet", ""),
-                    which=args.get("which", ""),
-                    no_print=args.get("no_print", ""),
-                    rpc_method=args.get("rpc_method", ""),
-                    use_colors=args.get("use_colors", ""),
-                    write_json=args.get(" write_json", ""),
-                    profiles_dir=args.get("profiles_dir", ""),
-                    partial_parse=args.get("partial_parse", ""),
-                    printer_width=args.get("printer_width", ""),
-                    static_parser=args.get("static_parser", ""),
-                    version_check=args.get("version_check", ""),
-                    event_buffer_size=args.get("event_buffer_size", ""),
-                    indirect_selection=args.get("indirect_selection", ""),
-                    send_anonymous=args.get("send_anonymous_usage_stats", ""),
-                    usage_stats=args.get("usage_stats", ""),
-                )
+                status.set(RUN_STATUS_PARSING)
+                returncode = self.run_dbt(dbt_command, workspace, profile_yml, stdout, status)
+                stdout.flush()
+                status.set(RUN_STATUS_INGESTING)
+                save_parse_state(parse_cache, workspace.commit, workspace.target_dir)
 
-                dbt_result.kill()
-                del dbt_result
+                DBTLogs.objects.filter(pk=dbt_log.pk).update(
+                    completed_at=datetime.now(),
+                    dbt_stdout=stdout.tail_text(),
+                    success=returncode == 0,
+                    fail_reason=None
+                    if returncode == 0
+                    else f"dbt exited with code {returncode}",
+                )
+                ingest_artifacts(dbt_log, workspace.target_dir)
+                if "deps" in dbt_subcommands(dbt_command):
+                    workspace.save_packages()
+                if returncode == 0 and parent_log_id is None:
+                    dispatch_downstream_tasks(instance, pipeline_run_id)
+                status.set(RUN_STATUS_DONE, success=returncode == 0)
 
         except Exception as err:
-            try:
-                dbt_result.kill()
-                del dbt_result
-            except Exception as err:
-                pass
-            instance = PeriodicTask.objects.get(id=pk)
-            DBTLogs.objects.create(
-                command=dbt_command,
-                periodic_task_name=instance.name,
-                completed_at=datetime.now(),
-                repository_used_name=instance.git_repo.name,
-                profile_yml_used_name=profile_yml.name,
-                previous_command="this is first commands"
-                if not DBTLogs.objects.all().exists()
-                else DBTLogs.objects.last().command,
-                success=False,
-                fail_reason=str(err),
-                dbt_stdout=stdout_data
-            )
+            if stdout is not None:
+                stdout.flush()
+            if dbt_log is not None:
+                DBTLogs.objects.filter(pk=dbt_log.pk).update(
+                    completed_at=datetime.now(),
+                    success=False,
+                    fail_reason=str(err),
+                    dbt_stdout=stdout.tail_text(),
+                )
+            else:
+                instance = PeriodicTask.objects.get(id=pk)
+                dbt_log = DBTLogs.objects.create_for_task(
+                    instance,
+                    command=dbt_command,
+                    run_id=run_id,
+                    pipeline_run_id=pipeline_run_id,
+                    parent_id=parent_log_id,
+                    completed_at=datetime.now(),
+                    repository_used_name=getattr(instance.git_repo, "name", None),
+                    profile_yml_used_name=getattr(instance.profile_yml, "name", None),
+                    success=False,
+                    fail_reason=str(err),
+                )
+            if status is not None:
+                status.set(RUN_STATUS_DONE, success=False, dbt_log_id=dbt_log.id)
+        finally:
+            if workspace is not None:
+                workspace.remove()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from dbt.analytics.models import DBTLogs
+from dbt.analytics.shards import merge_shards
+
+
+class Command(BaseCommand):
+    help = "Merge the results of the shards of a dbt run into the run's log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pk", action="store", type=int)  # pk is the DBTLogs id of the run
+
+    def handle(self, *args, **options):
+        dbt_log = DBTLogs.objects.summary().get(id=options["pk"])
+        count = merge_shards(dbt_log)
+        self.stdout.write(f"Merged {count} shards into {dbt_log.id}")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dbt.analytics.models import (
+    GIT_REPO_STATUS_CLONING,
+    GIT_REPO_STATUS_FAILED,
+    GIT_REPO_STATUS_READY,
+    GitRepo,
+)
+from dbt.utils.common import clone_git_repo
+
+# percent steps between two progress writes to the database
+PROGRESS_STEP = 5
+
+
+class Command(BaseCommand):
+    help = "Clone or update a git repo, recording its status and progress"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pk", action="store", type=int)  # pk is git repo object id
+
+    def handle(self, *args, **options):
+        git_repo = GitRepo.objects.get(id=options["pk"])
+        repo = GitRepo.objects.filter(pk=git_repo.pk)
+        repo.update(status=GIT_REPO_STATUS_CLONING, progress=0, status_message="")
+        last_progress = {"phase": None, "percent": 0}
+
+        def on_progress(phase, percent):
+            if phase == last_progress["phase"] and (
+                percent - last_progress["percent"] < PROGRESS_STEP and percent != 100
+            ):
+                return
+            last_progress.update(phase=phase, percent=percent)
+            repo.update(progress=percent, status_message=phase)
+
+        result, msg = clone_git_repo(git_repo, on_progress=on_progress)
+        if result:
+            repo.update(
+                status=GIT_REPO_STATUS_READY,
+                progress=100,
+                status_message="",
+                synced_at=timezone.now(),
+            )
+        else:
+            repo.update(status=GIT_REPO_STATUS_FAILED, status_message=msg)
+            self.stderr.write(f"Something is wrong while git cloning {msg}")
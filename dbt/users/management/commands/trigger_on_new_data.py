@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from dbt.analytics.freshness import trigger_on_new_data
+
+
+class Command(BaseCommand):
+    help = "Start the dbt tasks whose upstream sources received new data"
+
+    def handle(self, *args, **options):
+        started = trigger_on_new_data()
+        self.stdout.write(f"Started {len(started)} tasks")
@@ -7,6 +7,7 @@ from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
 from dbt.analytics.models import GitRepo, SSHKey, PeriodicTask
+from dbt.utils.git import remove_repo_checkouts
 
 SSH_KEY_PREFIX = getattr(settings, "SSH_KEY_PREFIX")
 
@@ -43,14 +44,7 @@ def on_git_repo_save(sender, instance, created, **kwargs):
 
 @receiver(pre_delete, sender=GitRepo)
 def on_gitrepo_delete(sender, instance, **kwargs):
-    os.environ["PATH"] += os.pathsep + "/usr/bin"
-    os.environ["PATH"] += os.pathsep + "/bin"
-    EXTERNAL_REPO_PREFIX = getattr(settings, "EXTERNAL_REPO_PREFIX")
-    THIS_PROJECT_PATH = getattr(settings, "THIS_PROJECT_PATH")
-    EXTERNAL_REPO_NAME = "{}-{}".format(EXTERNAL_REPO_PREFIX, instance.id)
-    destination = os.path.join(THIS_PROJECT_PATH, EXTERNAL_REPO_NAME)
-    if os.path.isdir(destination):  # if exist
-        subprocess.run(["rm", "-rf", destination], check=True, capture_output=True)
+    remove_repo_checkouts(instance.id)
 
 
 @receiver(post_save, sender=SSHKey)
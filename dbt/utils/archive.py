@@ -0,0 +1,60 @@
+import os
+
+import zstandard
+from django.conf import settings
+
+ARCHIVE_SUFFIX = ".zst"
+STDOUT_ARCHIVE_NAME = "stdout.txt"
+
+
+def archive_dir(dbt_log_id, created_at):
+    """Where the archive of a log goes, relative to ``DBT_ARCHIVE_PATH``."""
+    return f"{created_at:%Y/%m}/dbt-log-{dbt_log_id}"
+
+
+def blob_archive_dir(digest):
+    """Where the archive of an artifact blob goes; one file per content, shared by its logs."""
+    return f"blobs/{digest[:2]}"
+
+
+def blob_archive_name(digest):
+    return f"{digest}.json"
+
+
+def archive_file(relative_dir, name):
+    return os.path.join(
+        getattr(settings, "DBT_ARCHIVE_PATH"), relative_dir, name + ARCHIVE_SUFFIX
+    )
+
+
+def write_archive_file(relative_dir, name, chunks):
+    """Compress the text ``chunks`` into one archive file; it only appears once complete."""
+    path = archive_file(relative_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging_path = f"{path}.{os.getpid()}.tmp"
+    compressor = zstandard.ZstdCompressor(level=getattr(settings, "DBT_ARCHIVE_ZSTD_LEVEL"))
+    try:
+        with open(staging_path, "wb") as file:
+            with compressor.stream_writer(file) as writer:
+                for chunk in chunks:
+                    writer.write(chunk.encode("utf-8"))
+        os.replace(staging_path, path)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+    return path
+
+
+def archive_file_exists(relative_dir, name):
+    return os.path.exists(archive_file(relative_dir, name))
+
+
+def read_archive_file(relative_dir, name):
+    """The text of one archive file, or None when it was not archived."""
+    path = archive_file(relative_dir, name)
+    try:
+        with open(path, "rb") as file:
+            with zstandard.ZstdDecompressor().stream_reader(file) as reader:
+                return reader.read().decode("utf-8")
+    except FileNotFoundError:
+        return None
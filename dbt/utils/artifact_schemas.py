@@ -0,0 +1,63 @@
+"""The parts of the dbt artifacts this project reads.
+
+Artifacts are decoded straight into these structs: members that are not
+declared here are skipped by the decoder instead of being built into dicts.
+Members whose type differs between dbt versions or adapters are ``Any``, so
+that a new version does not make an artifact fail to decode.
+The structs hold no reference cycles, so they are kept out of the garbage
+collector.
+"""
+from typing import Any, Dict, List, Optional
+
+import msgspec
+
+
+class DependsOn(msgspec.Struct, gc=False):
+    nodes: List[str] = []
+
+
+class ManifestNode(msgspec.Struct, gc=False):
+    resource_type: str = ""
+    name: str = ""
+    fqn: List[str] = []
+    depends_on: DependsOn = msgspec.field(default_factory=DependsOn)
+
+
+class Manifest(msgspec.Struct, gc=False):
+    nodes: Dict[str, ManifestNode] = {}
+    sources: Dict[str, ManifestNode] = {}
+    exposures: Dict[str, ManifestNode] = {}
+    metrics: Dict[str, ManifestNode] = {}
+
+
+class Timing(msgspec.Struct, gc=False):
+    name: Optional[str] = None
+    started_at: Optional[str] = None
+    completed_at: Optional[str] = None
+
+
+class RunResult(msgspec.Struct, gc=False):
+    unique_id: str = ""
+    # a string since dbt 0.19, before that also the number of rows or a bool
+    status: Any = None
+    execution_time: Optional[float] = None
+    thread_id: Any = None
+    # free-form: adapters put text, numbers or nothing here
+    message: Any = None
+    adapter_response: Any = None
+    timing: List[Timing] = []
+
+
+class RunResults(msgspec.Struct, gc=False):
+    results: List[RunResult] = []
+    args: Dict[str, Any] = {}
+
+
+class SourceFreshnessResult(msgspec.Struct, gc=False):
+    unique_id: Optional[str] = None
+    status: Any = None
+    max_loaded_at: Optional[str] = None
+
+
+class Sources(msgspec.Struct, gc=False):
+    results: List[SourceFreshnessResult] = []
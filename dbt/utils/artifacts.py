@@ -0,0 +1,97 @@
+import hashlib
+import mmap
+import os
+
+import msgspec
+
+# dbt writes these files to the project's target directory
+ARTIFACT_NAMES = ("manifest", "run_results", "sources", "catalog")
+HASH_CHUNK_SIZE = 1024 * 1024
+# quote of a COPY in csv format that reads a whole artifact as one field:
+# JSON escapes every control character, so it never occurs in an artifact
+COPY_QUOTE = b"\x01"
+
+
+def artifact_path(target_dir, name):
+    return os.path.join(target_dir, f"{name}.json")
+
+
+def hash_artifact(file_path):
+    """Return ``(sha256 hexdigest, size)`` of an artifact, or ``(None, 0)`` if missing."""
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(file_path, "rb") as artifact:
+            for chunk in iter(lambda: artifact.read(HASH_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                size += len(chunk)
+    except OSError:
+        print(f"{file_path} not found")
+        return None, 0
+    return sha256.hexdigest(), size
+
+
+class QuotedArtifact:
+    """An artifact file read between two ``COPY_QUOTE``, for ``copy_expert``."""
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.head = self.tail = COPY_QUOTE
+
+    def read(self, size=-1):
+        if self.head:
+            data, self.head = self.head, b""
+            return data
+        data = self.artifact.read(size)
+        if data:
+            return data
+        data, self.tail = self.tail, b""
+        return data
+
+
+def read_artifact_text(file_path):
+    """Return the raw JSON text of an artifact, or None when it was not written.
+
+    The text is handed to the database as-is, so the artifact is never expanded
+    into Python objects (which costs several times the file size). It is still
+    the whole file in memory; PostgreSQL is sent the file with COPY instead.
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as artifact:
+            return artifact.read()
+    except OSError:
+        print(f"{file_path} not found")
+        return None
+
+
+class ArtifactDecodeError(Exception):
+    """An artifact was written but does not decode into its schema."""
+
+
+def decode_artifact(file_path, schema):
+    """Decode an artifact file into ``schema``, or None when it was not written.
+
+    The file is memory-mapped rather than read, so its raw bytes stay in the
+    page cache instead of the heap while the decoder walks over them. A file
+    that exists but does not decode raises ArtifactDecodeError: reading it as
+    empty would lose the results of the run without a trace.
+    """
+    try:
+        with open(file_path, "rb") as artifact:
+            if os.fstat(artifact.fileno()).st_size == 0:
+                raise ArtifactDecodeError(f"{file_path} is empty")
+            with mmap.mmap(artifact.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return msgspec.json.decode(data, type=schema)
+    except FileNotFoundError:
+        print(f"{file_path} not found")
+        return None
+    except msgspec.DecodeError as err:
+        raise ArtifactDecodeError(f"{file_path} could not be decoded: {err}") from err
+
+
+def decode_artifact_text(json_text, schema):
+    """Like decode_artifact, for JSON already read from the database."""
+    try:
+        return msgspec.json.decode(json_text, type=schema)
+    except msgspec.DecodeError as err:
+        raise ArtifactDecodeError(f"Artifact could not be decoded: {err}") from err
@@ -1,9 +1,13 @@
 import os
-import subprocess
 import yaml
-import re
 from importlib.metadata import version, PackageNotFoundError
-from django.conf import settings
+from dbt.utils.git import (
+    checkout_worktree,
+    mirror_lock,
+    repo_path,
+    resolve_commit,
+    sync_mirror,
+)
 
 
 def save_profile_yml(profile_yml_text_content, profile_dir):
@@ -15,40 +19,25 @@ def save_profile_yml(profile_yml_text_content, profile_dir):
         yaml.dump(dct, file)
 
 
-def clone_git_repo(instance) -> (bool, str):
+def clone_git_repo(instance, on_progress=None) -> (bool, str):
+    """Bring the working tree of ``instance`` up to date with the remote HEAD.
+
+    The first call makes a bare mirror of the repo; later calls only fetch what
+    changed into it and move the working tree (a git worktree of the mirror).
+    """
     os.environ["PATH"] += os.pathsep + "/usr/bin"
     os.environ["PATH"] += os.pathsep + "/bin"
-    EXTERNAL_REPO_PREFIX = getattr(settings, "EXTERNAL_REPO_PREFIX")
-    THIS_PROJECT_PATH = getattr(settings, "THIS_PROJECT_PATH")
-    EXTERNAL_REPO_NAME = "{}-{}".format(EXTERNAL_REPO_PREFIX, instance.id)
-    destination = os.path.join(THIS_PROJECT_PATH, EXTERNAL_REPO_NAME)
-    print(EXTERNAL_REPO_PREFIX, THIS_PROJECT_PATH, EXTERNAL_REPO_NAME, destination)
-    if os.path.isdir(destination):  # if exist
-        subprocess.run(["rm", "-rf", destination], check=True, capture_output=True)
-
-    if instance.url.startswith("git"):
-        pvt_key = os.path.join(
-            os.getenv("HOME"),
-            ".ssh/{}{}".format(
-                getattr(settings, "SSH_KEY_PREFIX"), instance.ssh_key.id
-            ),
-        )
-        cmd = 'eval "$(/usr/bin/ssh-agent -s)" && /usr/bin/ssh-add {} && /usr/bin/git clone {} {}'.format(
-            pvt_key, instance.url, destination
-        )
-    else:
-        cmd = "/usr/bin/git clone {} {}".format(instance.url, destination)
-
-    print(cmd)
-    p1 = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-
-    print(p1.stderr, "===")
-    result = True
-    msg = ""
-    if re.search("fatal:", p1.stderr.decode("UTF-8")):
-        result = False
-        msg = p1.stderr.decode("UTF-8")
-    return result, msg
+    with mirror_lock(instance.id):
+        result, msg = sync_mirror(instance, on_progress=on_progress)
+        if not result:
+            return result, msg
+        commit = resolve_commit(instance)
+        if commit is None:
+            return False, "fatal: could not resolve HEAD of the mirror"
+        result, msg = checkout_worktree(instance, repo_path(instance.id), commit)
+    if not result:
+        return result, msg
+    return True, ""
 
 
 # return current installed dbt version
@@ -71,3 +60,10 @@ def load_dbt_current_version() -> list[dict[str, str | None]]:
             {"module_name": module_name, "version": module_version}
         )
     return modules_version_data
+
+
+def load_dbt_core_version() -> str | None:
+    try:
+        return version("dbt-core")
+    except PackageNotFoundError:
+        return None
@@ -0,0 +1,29 @@
+import io
+
+import zstandard
+
+
+def compress_file(file_path, level):
+    """One zstd frame with the content of ``file_path``, or None when it is missing.
+
+    The file is streamed through the compressor, only the compressed bytes are
+    held in memory.
+    """
+    output = io.BytesIO()
+    try:
+        with open(file_path, "rb") as file:
+            zstandard.ZstdCompressor(level=level).copy_stream(file, output)
+    except OSError:
+        print(f"{file_path} not found")
+        return None
+    return output.getvalue()
+
+
+def compress_text(text, level):
+    return zstandard.ZstdCompressor(level=level).compress(text.encode("utf-8"))
+
+
+def decompress_text(data):
+    """The text of a zstd frame, also when the frame does not record its size."""
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+        return reader.read().decode("utf-8")
@@ -0,0 +1,280 @@
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import yaml
+from django.conf import settings
+
+from dbt.utils.common import save_profile_yml
+from dbt.utils.parse_cache import profile_hash
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "executor_worker.py")
+# commands using any of these need a shell and cannot be handed to the executor
+SHELL_CHARACTERS = set("&|;<>$`\n")
+
+
+class ExecutorError(Exception):
+    pass
+
+
+class ExecutorUnavailable(ExecutorError):
+    """The executor could not be started; the command has not been run."""
+
+
+def executor_args(dbt_command):
+    """Return the arguments of a single dbt invocation, or None when it needs a shell."""
+    if SHELL_CHARACTERS & set(dbt_command):
+        return None
+    try:
+        words = shlex.split(dbt_command)
+    except ValueError:
+        return None
+    if len(words) < 2 or words[0] != "dbt":
+        return None
+    return words[1:]
+
+
+class DBTExecutor:
+    """A dbt process that stays up between runs, with dbt and the adapters imported.
+
+    Runs are handed to it one at a time; its output is passed line by line to
+    ``on_line`` and the result comes back as a dict.
+    """
+
+    def __init__(self, adapters=None, warmup_profiles_dir=None, warmup_profile=None):
+        self.adapters = adapters or getattr(settings, "DBT_EXECUTOR_ADAPTERS")
+        self.warmup_profiles_dir = warmup_profiles_dir
+        # (profile, target) to connect with; there is no dbt_project.yml to name them
+        self.warmup_profile = warmup_profile
+        self.process = None
+        self.sentinel = f"@@dbt-executor-{uuid.uuid4().hex}@@"
+        self.runs = 0
+        self.last_used = time.monotonic()
+        self.profile_hash = None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        env = dict(
+            os.environ,
+            DBT_EXECUTOR_SENTINEL=self.sentinel,
+            DBT_EXECUTOR_ADAPTERS=",".join(self.adapters),
+            PYTHONUNBUFFERED="1",
+        )
+        try:
+            self.process = subprocess.Popen(
+                # -E: a PYTHONPATH with the project root would shadow dbt-core,
+                # -u: output reaches the run line by line, not when a buffer fills
+                [getattr(settings, "DBT_EXECUTOR_PYTHON"), "-E", "-u", WORKER_SCRIPT],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=env,
+            )
+            response = self.read_response(print)
+        except (OSError, ExecutorError) as err:
+            self.close()
+            raise ExecutorUnavailable(str(err))
+        if not response.get("ready"):
+            self.close()
+            raise ExecutorUnavailable(response.get("exception") or "executor did not start")
+        print(f"dbt executor started, pid {response['pid']}")
+        if self.warmup_profiles_dir and self.warmup_profile:
+            # parses the profile and opens a connection, loading the driver
+            profile, target = self.warmup_profile
+            args = ["debug", "--connection", "--profiles-dir", self.warmup_profiles_dir]
+            args += ["--profile", profile]
+            if target:
+                args += ["--target", target]
+            try:
+                response = self.run(
+                    args,
+                    cwd=self.warmup_profiles_dir,
+                    on_line=lambda line: None,
+                )
+            except ExecutorError as err:
+                # nothing of the run was started yet, it can still go to a subprocess
+                raise ExecutorUnavailable(f"dbt executor died while warming up: {err}")
+            self.runs = 0
+            if not response.get("success"):
+                print(f"dbt executor could not connect: {response.get('exception')}")
+
+    def run(self, args, cwd, env=None, on_line=print):
+        """Run ``dbt <args>`` in ``cwd``; returns ``{"success": bool, "exception": str}``."""
+        if not self.alive():
+            self.start()
+        request = {"args": args, "cwd": cwd, "env": env or {}}
+        try:
+            self.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+            self.process.stdin.flush()
+        except OSError as err:
+            self.close()
+            raise ExecutorUnavailable(str(err))
+        self.runs += 1
+        self.last_used = time.monotonic()
+        try:
+            return self.read_response(on_line)
+        except ExecutorError:
+            self.close()
+            raise
+
+    def read_response(self, on_line):
+        for line in self.process.stdout:
+            line = line.decode("utf-8", errors="replace")
+            if line.startswith(self.sentinel):
+                return json.loads(line[len(self.sentinel):])
+            on_line(line)
+        raise ExecutorError(f"dbt executor exited with code {self.process.wait()}")
+
+    def rss_mb(self):
+        """Resident memory of the executor in MB, or 0 when it cannot be read."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except (OSError, AttributeError, ValueError):
+            pass
+        return 0
+
+    def worn_out(self):
+        """True once the executor served its runs or grew past its memory budget."""
+        max_runs = getattr(settings, "DBT_EXECUTOR_MAX_RUNS")
+        max_rss_mb = getattr(settings, "DBT_EXECUTOR_MAX_RSS_MB")
+        return (max_runs and self.runs >= max_runs) or (
+            max_rss_mb and self.rss_mb() >= max_rss_mb
+        )
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+def profile_adapters(profile_yml_content):
+    """Adapter types used by the outputs of a profiles.yml."""
+    adapters = set()
+    for profile in (yaml.safe_load(profile_yml_content) or {}).values():
+        if isinstance(profile, dict):
+            for output in (profile.get("outputs") or {}).values():
+                if isinstance(output, dict) and output.get("type"):
+                    adapters.add(output["type"])
+    return sorted(adapters)
+
+
+def default_profile(profile_yml_content):
+    """``(profile, target)`` of the first profile of a profiles.yml with outputs, or None."""
+    for name, profile in (yaml.safe_load(profile_yml_content) or {}).items():
+        if isinstance(profile, dict) and profile.get("outputs"):
+            return name, profile.get("target")
+    return None
+
+
+class ExecutorPool:
+    """Up to ``DBT_EXECUTOR_POOL_SIZE`` warm executors per ProfileYAML, in this process.
+
+    An executor only imports the adapters of its profile and is recycled after
+    ``DBT_EXECUTOR_MAX_RUNS`` runs, once it grows past ``DBT_EXECUTOR_MAX_RSS_MB``,
+    when it sat idle for ``DBT_EXECUTOR_IDLE_SECONDS`` or when the profile changed.
+    """
+
+    def __init__(self):
+        self.idle = {}
+        self.sizes = {}
+        self.hashes = {}
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, profile_yml):
+        executor = self.checkout(profile_yml)
+        try:
+            yield executor
+        finally:
+            self.checkin(profile_yml.id, executor)
+
+    def checkout(self, profile_yml):
+        key = profile_yml.id
+        content_hash = profile_hash(profile_yml.profile_yml)
+        with self.condition:
+            if self.hashes.get(key) != content_hash:
+                self.close_idle(key)
+                self.hashes[key] = content_hash
+            self.close_stale()
+            while not self.idle.get(key) and self.sizes.get(key, 0) >= self.size():
+                self.condition.wait()
+            if self.idle.get(key):
+                return self.idle[key].pop()
+            self.sizes[key] = self.sizes.get(key, 0) + 1
+        try:
+            executor = DBTExecutor(
+                adapters=profile_adapters(profile_yml.profile_yml),
+                warmup_profiles_dir=self.warmup_profiles_dir(profile_yml),
+                warmup_profile=default_profile(profile_yml.profile_yml),
+            )
+            executor.profile_hash = content_hash
+            executor.start()
+        except Exception:
+            self.discard(key)
+            raise
+        return executor
+
+    def checkin(self, key, executor):
+        if (
+            not executor.alive()
+            or executor.worn_out()
+            or executor.profile_hash != self.hashes.get(key)
+        ):
+            print(f"Recycling dbt executor after {executor.runs} runs")
+            executor.close()
+            self.discard(key)
+            return
+        with self.condition:
+            self.idle.setdefault(key, []).append(executor)
+            self.condition.notify()
+
+    def discard(self, key):
+        with self.condition:
+            self.sizes[key] -= 1
+            self.condition.notify()
+
+    def close_idle(self, key):
+        for executor in self.idle.pop(key, []):
+            executor.close()
+            self.sizes[key] -= 1
+
+    def close_stale(self):
+        idle_seconds = getattr(settings, "DBT_EXECUTOR_IDLE_SECONDS")
+        now = time.monotonic()
+        for key, executors in self.idle.items():
+            for executor in list(executors):
+                if not executor.alive() or (idle_seconds and now - executor.last_used > idle_seconds):
+                    executors.remove(executor)
+                    executor.close()
+                    self.sizes[key] -= 1
+
+    def size(self):
+        return max(getattr(settings, "DBT_EXECUTOR_POOL_SIZE"), 1)
+
+    def warmup_profiles_dir(self, profile_yml):
+        if not getattr(settings, "DBT_EXECUTOR_OPEN_CONNECTION"):
+            return None
+        profiles_dir = os.path.join(getattr(settings, "GIT_RUNS_PATH"), f"profile-{profile_yml.id}")
+        os.makedirs(profiles_dir, exist_ok=True)
+        save_profile_yml(profile_yml.profile_yml, os.path.join(profiles_dir, "profiles.yml"))
+        return profiles_dir
+
+
+# kept by every worker process between tasks
+executor_pool = ExecutorPool()
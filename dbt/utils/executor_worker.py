@@ -0,0 +1,61 @@
+"""A long-lived dbt process, driven by dbt.utils.executor.
+
+This file is run as a script and never imported: the project's own ``dbt``
+package would shadow dbt-core, so the directory of the script is dropped from
+``sys.path`` before dbt is imported.
+
+Requests are JSON lines on stdin: ``{"args": [...], "cwd": ..., "env": {...}}``.
+dbt's output goes to stdout as usual and every request is answered with one
+line starting with ``DBT_EXECUTOR_SENTINEL`` followed by a JSON object.
+"""
+import importlib
+import json
+import os
+import sys
+
+sys.path[:] = [path for path in sys.path if path not in ("", os.path.dirname(os.path.abspath(__file__)))]
+
+
+def respond(sentinel, **response):
+    sys.stdout.flush()
+    sys.stdout.write(sentinel + json.dumps(response) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    sentinel = os.environ["DBT_EXECUTOR_SENTINEL"]
+    try:
+        from dbt.cli.main import dbtRunner
+
+        # importing the adapters is most of the start-up time of a dbt command
+        for adapter in filter(None, os.environ.get("DBT_EXECUTOR_ADAPTERS", "").split(",")):
+            try:
+                importlib.import_module(f"dbt.adapters.{adapter}")
+            except ImportError:
+                pass
+    except Exception as err:
+        respond(sentinel, ready=False, exception=repr(err))
+        return 1
+    respond(sentinel, ready=True, pid=os.getpid())
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        os.chdir(request["cwd"])
+        # the env of a run must not leak into the next one
+        environ = dict(os.environ)
+        os.environ.update(request.get("env") or {})
+        try:
+            result = dbtRunner().invoke(request["args"])
+            exception = repr(result.exception) if result.exception is not None else None
+            respond(sentinel, success=result.success, exception=exception)
+        except (Exception, SystemExit) as err:
+            # click exits on bad arguments; keep serving the next request
+            respond(sentinel, success=False, exception=repr(err))
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import fcntl
+import os
+import re
+import shutil
+import subprocess
+from contextlib import contextmanager
+
+from django.conf import settings
+
+GIT_BIN = "/usr/bin/git"
+# e.g. "Receiving objects:  45% (450/1000), 1.20 MiB | 2.00 MiB/s"
+PROGRESS_RE = re.compile(r"([A-Za-z ]+):\s+(\d+)%")
+
+
+def repo_path(repo_id):
+    """Working tree a repo's tasks run in."""
+    return os.path.join(
+        getattr(settings, "THIS_PROJECT_PATH"),
+        "{}-{}".format(getattr(settings, "EXTERNAL_REPO_PREFIX"), repo_id),
+    )
+
+
+def mirror_path(repo_id):
+    """Bare clone the working trees of a repo are checked out from."""
+    return os.path.join(
+        getattr(settings, "GIT_MIRRORS_PATH"),
+        "{}-{}.git".format(getattr(settings, "EXTERNAL_REPO_PREFIX"), repo_id),
+    )
+
+
+@contextmanager
+def mirror_lock(repo_id):
+    """Serialize fetches and worktree changes on one mirror across processes."""
+    lock_path = mirror_path(repo_id) + ".lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def git_env(instance):
+    env = dict(os.environ)
+    if instance.url.startswith("git"):
+        pvt_key = os.path.join(
+            os.getenv("HOME"),
+            ".ssh/{}{}".format(getattr(settings, "SSH_KEY_PREFIX"), instance.ssh_key.id),
+        )
+        env["GIT_SSH_COMMAND"] = f"ssh -i {pvt_key} -o IdentitiesOnly=yes"
+    return env
+
+
+def run_git(instance, *args, cwd=None):
+    """Run a git command with the credentials of ``instance``; returns (ok, output)."""
+    p1 = subprocess.run(
+        [GIT_BIN, *args],
+        cwd=cwd,
+        env=git_env(instance),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    output = p1.stderr.decode("UTF-8", errors="replace")
+    if p1.returncode != 0:
+        print(f"git {' '.join(args[:2])} failed: {output}")
+        return False, output
+    return True, p1.stdout.decode("UTF-8", errors="replace").strip()
+
+
+def run_git_with_progress(instance, *args, cwd=None, on_progress=None):
+    """Like run_git, passing git's progress to ``on_progress(phase, percent)``."""
+    if on_progress is None:
+        return run_git(instance, *args, cwd=cwd)
+    p1 = subprocess.Popen(
+        [GIT_BIN, args[0], "--progress", *args[1:]],
+        cwd=cwd,
+        env=git_env(instance),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    output = []
+    pending = b""
+    for data in iter(lambda: p1.stderr.read1(4096), b""):
+        # progress lines are redrawn with \r, so split on both line endings
+        *lines, pending = re.split(rb"[\r\n]", pending + data)
+        for line in lines:
+            line = line.decode("UTF-8", errors="replace")
+            match = PROGRESS_RE.search(line)
+            if match:
+                on_progress(match.group(1).strip(), int(match.group(2)))
+            elif line:
+                output.append(line)
+    p1.wait()
+    output = "\n".join(output + [pending.decode("UTF-8", errors="replace")])
+    if p1.returncode != 0:
+        print(f"git {' '.join(args[:2])} failed: {output}")
+        return False, output
+    return True, ""
+
+
+def fetch_options():
+    options = []
+    depth = getattr(settings, "GIT_CLONE_DEPTH")
+    if depth:
+        options.append(f"--depth={depth}")
+    clone_filter = getattr(settings, "GIT_CLONE_FILTER")
+    if clone_filter:
+        options.append(f"--filter={clone_filter}")
+    return options
+
+
+def sync_mirror(instance, on_progress=None):
+    """Create the bare mirror of ``instance`` or fetch what changed since last time."""
+    mirror = mirror_path(instance.id)
+    if not os.path.isdir(mirror):
+        os.makedirs(os.path.dirname(mirror), exist_ok=True)
+        result, msg = run_git_with_progress(
+            instance,
+            "clone",
+            "--bare",
+            *fetch_options(),
+            instance.url,
+            mirror,
+            on_progress=on_progress,
+        )
+        if not result:
+            shutil.rmtree(mirror, ignore_errors=True)
+            return result, msg
+        # a bare clone has no fetch refspec; keep every branch up to date
+        run_git(
+            instance,
+            "config",
+            "remote.origin.fetch",
+            "+refs/heads/*:refs/heads/*",
+            cwd=mirror,
+        )
+        return result, msg
+    run_git(instance, "remote", "set-url", "origin", instance.url, cwd=mirror)
+    return run_git_with_progress(
+        instance,
+        "fetch",
+        "--prune",
+        *fetch_options(),
+        "origin",
+        cwd=mirror,
+        on_progress=on_progress,
+    )
+
+
+def resolve_commit(instance, rev="HEAD"):
+    result, sha = run_git(instance, "rev-parse", "--verify", rev, cwd=mirror_path(instance.id))
+    return sha if result else None
+
+
+def checkout_worktree(instance, path, commit):
+    """Point the working tree at ``path`` to ``commit``, creating it from the mirror."""
+    if os.path.isfile(os.path.join(path, ".git")):
+        return run_git(instance, "checkout", "--detach", "--force", commit, cwd=path)
+    # a stand-alone clone made before mirrors were used, or a broken tree
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    return add_worktree(instance, path, commit)
+
+
+def add_worktree(instance, path, commit):
+    mirror = mirror_path(instance.id)
+    run_git(instance, "worktree", "prune", cwd=mirror)
+    return run_git(instance, "worktree", "add", "--detach", "--force", path, commit, cwd=mirror)
+
+
+def remove_worktree(instance, path):
+    mirror = mirror_path(instance.id)
+    run_git(instance, "worktree", "remove", "--force", path, cwd=mirror)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    run_git(instance, "worktree", "prune", cwd=mirror)
+
+
+def remove_repo_checkouts(repo_id):
+    for path in (repo_path(repo_id), mirror_path(repo_id)):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
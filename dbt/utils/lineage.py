@@ -0,0 +1,126 @@
+from array import array
+from collections import deque
+from typing import List
+
+import msgspec
+
+from dbt.utils.artifact_schemas import Manifest
+from dbt.utils.artifacts import decode_artifact, decode_artifact_text
+
+LINEAGE_UPSTREAM = "upstream"
+LINEAGE_DOWNSTREAM = "downstream"
+LINEAGE_DIRECTIONS = (LINEAGE_UPSTREAM, LINEAGE_DOWNSTREAM)
+
+
+class LineageData(msgspec.Struct, gc=False):
+    node_ids: List[str]
+    parent_offsets: bytes
+    parent_indices: bytes
+    child_offsets: bytes
+    child_indices: bytes
+
+
+def csr(adjacency, node_count):
+    """``(offsets, indices)`` of adjacency lists: the neighbours of node i are
+    ``indices[offsets[i]:offsets[i + 1]]``."""
+    offsets = array("I", [0])
+    indices = array("I")
+    for node in range(node_count):
+        indices.extend(sorted(adjacency[node]))
+        offsets.append(len(indices))
+    return offsets, indices
+
+
+class LineageGraph:
+    """Parents and children of every node of a manifest, in compressed sparse rows.
+
+    Nodes are numbered in the order of ``node_ids``; a walk only touches the
+    rows of the nodes it reaches, so it does not depend on the size of the project.
+    """
+
+    def __init__(self, node_ids, parent_offsets, parent_indices, child_offsets, child_indices):
+        self.node_ids = node_ids
+        self.index = {unique_id: number for number, unique_id in enumerate(node_ids)}
+        self.rows = {
+            LINEAGE_UPSTREAM: (parent_offsets, parent_indices),
+            LINEAGE_DOWNSTREAM: (child_offsets, child_indices),
+        }
+
+    @property
+    def edge_count(self):
+        return len(self.rows[LINEAGE_UPSTREAM][1])
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        nodes = {**manifest.sources, **manifest.nodes, **manifest.exposures, **manifest.metrics}
+        node_ids = sorted(nodes)
+        index = {unique_id: number for number, unique_id in enumerate(node_ids)}
+        parents = [set() for _ in node_ids]
+        children = [set() for _ in node_ids]
+        for unique_id, node in nodes.items():
+            child = index[unique_id]
+            for parent_id in node.depends_on.nodes:
+                parent = index.get(parent_id)
+                if parent is not None:
+                    parents[child].add(parent)
+                    children[parent].add(child)
+        return cls(node_ids, *csr(parents, len(node_ids)), *csr(children, len(node_ids)))
+
+    @classmethod
+    def from_bytes(cls, data):
+        lineage = msgspec.msgpack.decode(data, type=LineageData)
+        arrays = []
+        for name in ("parent_offsets", "parent_indices", "child_offsets", "child_indices"):
+            values = array("I")
+            values.frombytes(getattr(lineage, name))
+            arrays.append(values)
+        return cls(lineage.node_ids, *arrays)
+
+    def to_bytes(self):
+        parent_offsets, parent_indices = self.rows[LINEAGE_UPSTREAM]
+        child_offsets, child_indices = self.rows[LINEAGE_DOWNSTREAM]
+        return msgspec.msgpack.encode(
+            LineageData(
+                node_ids=self.node_ids,
+                parent_offsets=parent_offsets.tobytes(),
+                parent_indices=parent_indices.tobytes(),
+                child_offsets=child_offsets.tobytes(),
+                child_indices=child_indices.tobytes(),
+            )
+        )
+
+    def walk(self, unique_id, direction, max_depth=None):
+        """``[(unique_id, depth)]`` of every node up- or downstream of ``unique_id``,
+        nearest first; None when the node is not in the manifest."""
+        start = self.index.get(unique_id)
+        if start is None:
+            return None
+        offsets, indices = self.rows[direction]
+        depths = {start: 0}
+        pending = deque([start])
+        found = []
+        while pending:
+            node = pending.popleft()
+            depth = depths[node]
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for neighbour in indices[offsets[node] : offsets[node + 1]]:
+                if neighbour not in depths:
+                    depths[neighbour] = depth + 1
+                    found.append((self.node_ids[neighbour], depth + 1))
+                    pending.append(neighbour)
+        return found
+
+
+def build_lineage(manifest_text=None, manifest_path=None):
+    """The lineage of a manifest given as JSON text or as a file, None when there is no file.
+
+    Raises ArtifactDecodeError when the manifest does not decode.
+    """
+    if manifest_path is not None:
+        manifest = decode_artifact(manifest_path, Manifest)
+    else:
+        manifest = decode_artifact_text(manifest_text, Manifest)
+    if manifest is None:
+        return None
+    return LineageGraph.from_manifest(manifest)
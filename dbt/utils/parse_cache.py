@@ -0,0 +1,86 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+
+# what dbt needs to skip parsing the project again; never the manifest, a run
+# that fails before dbt writes its own would be logged with the restored one
+PARSE_STATE_FILES = ("partial_parse.msgpack",)
+
+
+def profile_hash(profile_yml_content):
+    return hashlib.sha256(profile_yml_content.encode("utf-8")).hexdigest()
+
+
+def parse_cache_dir(repo_id, profile_yml_content, dbt_version):
+    """Cache of parse states for one repo, profile and dbt version; one entry per commit."""
+    return os.path.join(
+        getattr(settings, "DBT_PARSE_CACHE_PATH"),
+        "{}-{}".format(getattr(settings, "EXTERNAL_REPO_PREFIX"), repo_id),
+        "{}-{}".format(profile_hash(profile_yml_content)[:16], dbt_version or "unknown"),
+    )
+
+
+def restore_parse_state(cache_dir, commit, target_dir):
+    """Copy the saved state of ``commit`` (or else the newest one) into ``target_dir``.
+
+    A state saved for another commit is still worth restoring: dbt only
+    re-parses the files whose checksum changed. Returns the commit restored.
+    """
+    if not os.path.isdir(cache_dir):
+        return None
+    entries = sorted(
+        (entry for entry in os.scandir(cache_dir) if entry.is_dir() and "." not in entry.name),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    entry = next((entry for entry in entries if entry.name == commit), None)
+    if entry is None and entries:
+        entry = entries[0]
+    if entry is None:
+        return None
+    os.makedirs(target_dir, exist_ok=True)
+    for filename in PARSE_STATE_FILES:
+        source = os.path.join(entry.path, filename)
+        if os.path.isfile(source):
+            shutil.copy2(source, os.path.join(target_dir, filename))
+    return entry.name
+
+
+def save_parse_state(cache_dir, commit, target_dir):
+    """Save the parse state dbt left in ``target_dir`` under ``commit``."""
+    if not commit or not os.path.isfile(os.path.join(target_dir, PARSE_STATE_FILES[0])):
+        return False
+    os.makedirs(cache_dir, exist_ok=True)
+    # fill a private directory first so readers never see half a state
+    staging_dir = os.path.join(cache_dir, f"{commit}.{uuid.uuid4().hex}")
+    os.makedirs(staging_dir)
+    for filename in PARSE_STATE_FILES:
+        source = os.path.join(target_dir, filename)
+        if os.path.isfile(source):
+            shutil.copy2(source, os.path.join(staging_dir, filename))
+    entry_dir = os.path.join(cache_dir, commit)
+    try:
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.rename(staging_dir, entry_dir)
+    except OSError as err:
+        # the same commit is being saved by another run
+        print(f"Could not save parse state of {commit}: {err}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
+    os.utime(entry_dir)
+    prune_parse_states(cache_dir)
+    return True
+
+
+def prune_parse_states(cache_dir):
+    entries = sorted(
+        (entry for entry in os.scandir(cache_dir) if entry.is_dir() and "." not in entry.name),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in entries[getattr(settings, "DBT_PARSE_CACHE_KEEP"):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,87 @@
+import json
+import re
+import time
+
+from django.conf import settings
+from redis import RedisError
+
+from dbt.utils.slots import get_redis
+
+RUN_STATUS_QUEUED = "queued"
+RUN_STATUS_CLONING = "cloning"
+RUN_STATUS_PARSING = "parsing"
+RUN_STATUS_RUNNING = "running"
+RUN_STATUS_INGESTING = "ingesting"
+RUN_STATUS_DONE = "done"
+# dbt prints this once the project is parsed, e.g. "Found 50 models, 1 source, ..."
+PARSED_RE = re.compile(r"\bFound \d+ (models?|seeds?|snapshots?|tests?|sources?)\b")
+
+
+def run_status_key(run_id):
+    return f"dbt:run:{run_id}"
+
+
+class RunStatus:
+    """The live status of one run, kept in Redis so it can be watched without the database.
+
+    Every change bumps ``version`` and is published on the key's channel, which
+    is what the long-poll and event-stream endpoints wait on.
+    """
+
+    def __init__(self, run_id, client=None):
+        self.run_id = run_id
+        self.key = run_status_key(run_id)
+        self.client = client or get_redis()
+        self.status = None
+
+    def set(self, status, **fields):
+        self.status = status
+        if self.run_id is None:
+            # started without a run id, e.g. straight from the command line
+            return
+        fields = {
+            name: json.dumps(value) for name, value in dict(fields, status=status).items()
+        }
+        fields["updated_at"] = json.dumps(time.time())
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.hset(self.key, mapping=fields)
+            pipeline.hincrby(self.key, "version", 1)
+            pipeline.expire(self.key, getattr(settings, "DBT_RUN_STATUS_SECONDS"))
+            pipeline.publish(self.key, status)
+            pipeline.execute()
+        except RedisError as err:
+            print(f"Could not save the status of run {self.run_id}: {err}")
+
+    def get(self):
+        """The status as a dict, or None when the run is unknown or expired."""
+        values = self.client.hgetall(self.key)
+        if not values:
+            return None
+        status = {
+            name.decode("utf-8"): json.loads(value)
+            for name, value in values.items()
+            if name != b"version"
+        }
+        status["version"] = int(values.get(b"version", 0))
+        status["run_id"] = self.run_id
+        return status
+
+    def wait(self, version, timeout):
+        """Return the status once its version is past ``version``, or when ``timeout`` is up."""
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.key)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                status = self.get()
+                if status is None or status["version"] > version:
+                    return status
+                if status["status"] == RUN_STATUS_DONE:
+                    return status
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return status
+                pubsub.get_message(timeout=min(remaining, 1.0))
+        finally:
+            pubsub.close()
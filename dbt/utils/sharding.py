@@ -0,0 +1,111 @@
+import heapq
+import shlex
+
+from dbt.utils.artifact_schemas import Manifest
+from dbt.utils.artifacts import decode_artifact
+from dbt.utils.executor import executor_args
+from dbt.utils.state import SELECT_FLAGS
+
+# nodes each shardable subcommand runs
+SHARD_RESOURCE_TYPES = {
+    "run": ("model",),
+    "build": ("model", "seed", "snapshot", "test"),
+}
+# seconds assumed for a node that has no timing yet
+DEFAULT_NODE_SECONDS = 1.0
+
+
+def shardable_args(dbt_command):
+    """Arguments of a whole-project run/build that can be split, else None."""
+    args = executor_args(dbt_command)
+    if not args or args[0] not in SHARD_RESOURCE_TYPES:
+        return None
+    if any(arg.split("=")[0] in SELECT_FLAGS + ("--exclude", "--state") for arg in args):
+        return None
+    return args
+
+
+def manifest_graph(manifest_path, resource_types):
+    """Return ``(selectors, edges)`` of the nodes of ``resource_types`` in a manifest.
+
+    ``selectors`` maps unique_id to the fqn selector of the node; ``edges`` are
+    (parent, child) pairs between those nodes.
+    """
+    selectors = {}
+    parents = {}
+    manifest = decode_artifact(manifest_path, Manifest) or Manifest()
+    for unique_id, node in manifest.nodes.items():
+        if node.resource_type not in resource_types:
+            continue
+        selectors[unique_id] = "fqn:" + ".".join(node.fqn or [node.name])
+        parents[unique_id] = node.depends_on.nodes
+    edges = [
+        (parent, child)
+        for child, child_parents in parents.items()
+        for parent in child_parents
+        if parent in selectors
+    ]
+    return selectors, edges
+
+
+def upstream_sources(manifest_path, node_ids):
+    """Sources that ``node_ids`` (default: every node) read from, directly or through other nodes."""
+    manifest = decode_artifact(manifest_path, Manifest) or Manifest()
+    parents = {unique_id: node.depends_on.nodes for unique_id, node in manifest.nodes.items()}
+    sources = set()
+    seen = set()
+    if node_ids is None:
+        node_ids = parents
+    pending = [node_id for node_id in node_ids if node_id in parents]
+    while pending:
+        node_id = pending.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        for parent in parents.get(node_id, []):
+            if parent.startswith("source."):
+                sources.add(parent)
+            else:
+                pending.append(parent)
+    return sources
+
+
+def connected_components(nodes, edges):
+    """Group nodes that are linked by any chain of edges, ignoring direction."""
+    roots = {node: node for node in nodes}
+
+    def find(node):
+        while roots[node] != node:
+            roots[node] = roots[roots[node]]
+            node = roots[node]
+        return node
+
+    for parent, child in edges:
+        roots[find(parent)] = find(child)
+    components = {}
+    for node in nodes:
+        components.setdefault(find(node), []).append(node)
+    return list(components.values())
+
+
+def pack_shards(components, durations, count):
+    """Spread components over ``count`` shards, longest first onto the least loaded one.
+
+    A component is never split, so dependencies never cross shards.
+    """
+    shards = [(0.0, index, []) for index in range(count)]
+    weighted = sorted(
+        components,
+        key=lambda component: sum(durations.get(node, DEFAULT_NODE_SECONDS) for node in component),
+        reverse=True,
+    )
+    for component in weighted:
+        load, index, nodes = heapq.heappop(shards)
+        nodes.extend(component)
+        load += sum(durations.get(node, DEFAULT_NODE_SECONDS) for node in component)
+        heapq.heappush(shards, (load, index, nodes))
+    return [nodes for _, _, nodes in sorted(shards, key=lambda shard: shard[1]) if nodes]
+
+
+def shard_command(args, selectors):
+    return " ".join(["dbt", *map(shlex.quote, args), "--select", *selectors])
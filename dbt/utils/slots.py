@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+# KEYS: holders and waiters zsets of every scope, two keys per scope
+# ARGV: ticket, now, lease expiry, waiter score, stale waiter cutoff, then the limit of every scope
+#
+# A ticket gets its slots only when it fits in every scope at once and is
+# among the first waiters of each, so runs are served by priority, then in
+# the order they asked.
+ACQUIRE_SCRIPT = """
+local ticket, now, expires, score, stale = ARGV[1], tonumber(ARGV[2]), ARGV[3], ARGV[4], tonumber(ARGV[5])
+local scopes = #KEYS / 2
+local ready = true
+for i = 1, scopes do
+    local holders, waiters = KEYS[2 * i - 1], KEYS[2 * i]
+    local limit = tonumber(ARGV[5 + i])
+    redis.call("ZREMRANGEBYSCORE", holders, "-inf", now)
+    if redis.call("ZSCORE", holders, ticket) then
+        return 1
+    end
+    redis.call("ZADD", waiters, "NX", score, ticket)
+    redis.call("HSET", waiters .. ":seen", ticket, now)
+    for _, waiter in ipairs(redis.call("ZRANGE", waiters, 0, -1)) do
+        local seen = tonumber(redis.call("HGET", waiters .. ":seen", waiter) or 0)
+        if seen < stale then
+            redis.call("ZREM", waiters, waiter)
+            redis.call("HDEL", waiters .. ":seen", waiter)
+        end
+    end
+    local free = limit - redis.call("ZCARD", holders)
+    local rank = redis.call("ZRANK", waiters, ticket)
+    if free <= 0 or rank == false or rank >= free then
+        ready = false
+    end
+end
+if not ready then
+    return 0
+end
+for i = 1, scopes do
+    local holders, waiters = KEYS[2 * i - 1], KEYS[2 * i]
+    redis.call("ZREM", waiters, ticket)
+    redis.call("HDEL", waiters .. ":seen", ticket)
+    redis.call("ZADD", holders, expires, ticket)
+end
+return 1
+"""
+
+
+def get_redis():
+    return redis.Redis.from_url(getattr(settings, "CELERY_BROKER_URL"))
+
+
+def queue_score(priority=0):
+    """Place of a run in the queues: by priority, then in the order runs first asked."""
+    return priority * 1e10 + time.time()
+
+
+class RunSlots:
+    """Counting semaphores in Redis, taken together for several scopes.
+
+    ``limits`` maps a scope name (e.g. ``"profile:3"``) to the number of runs
+    allowed in it at a time. A slot is a lease that has to be renewed while
+    the run goes on, so the slots of a worker that died free up by themselves.
+    """
+
+    def __init__(self, limits, client=None):
+        self.limits = limits
+        self.client = client or get_redis()
+        self.lease_seconds = getattr(settings, "DBT_SLOT_LEASE_SECONDS")
+        self.acquire_script = self.client.register_script(ACQUIRE_SCRIPT)
+
+    def keys(self):
+        keys = []
+        for scope in self.limits:
+            keys += [f"dbt:slots:{scope}:holders", f"dbt:slots:{scope}:waiters"]
+        return keys
+
+    def acquire(self, ticket, score):
+        """Take a slot in every scope, or join their queues; True once the slots are held.
+
+        ``score`` is the place in the queues from ``queue_score``, lowest first;
+        the caller keeps it between attempts. A waiter that stops asking for
+        longer than ``DBT_SLOT_RETRY_SECONDS`` times three is dropped from the
+        queues, and gets its place back with the same score when it asks again.
+        """
+        now = time.time()
+        stale = now - 3 * getattr(settings, "DBT_SLOT_RETRY_SECONDS")
+        return bool(
+            self.acquire_script(
+                keys=self.keys(),
+                args=[ticket, now, now + self.lease_seconds, score, stale, *self.limits.values()],
+            )
+        )
+
+    def renew(self, ticket):
+        expires = time.time() + self.lease_seconds
+        pipeline = self.client.pipeline()
+        for holders in self.keys()[::2]:
+            pipeline.zadd(holders, {ticket: expires}, xx=True)
+        pipeline.execute()
+
+    def release(self, ticket):
+        pipeline = self.client.pipeline()
+        for holders, waiters in zip(self.keys()[::2], self.keys()[1::2]):
+            pipeline.zrem(holders, ticket)
+            pipeline.zrem(waiters, ticket)
+            pipeline.hdel(f"{waiters}:seen", ticket)
+        pipeline.execute()
+
+    @contextmanager
+    def held(self, ticket):
+        """Renew the slots of ``ticket`` while the block runs, then give them back."""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew(ticket)
+                except redis.RedisError as err:
+                    print(f"Could not renew run slots of {ticket}: {err}")
+
+        threading.Thread(target=renew, daemon=True).start()
+        try:
+            yield
+        finally:
+            stop.set()
+            self.release(ticket)
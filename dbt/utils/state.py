@@ -0,0 +1,61 @@
+import os
+import re
+import shlex
+
+# dbt subcommands that take --state, --select and --defer
+STATE_SUBCOMMANDS = ("run", "build", "test", "seed", "snapshot", "compile")
+SELECT_FLAGS = ("--select", "-s", "--models", "-m", "--selector")
+# a shell command line may chain several dbt invocations
+COMMAND_SEPARATOR_RE = re.compile(r"(\s*(?:&&|\|\||;)\s*)")
+
+
+def dbt_subcommands(dbt_command):
+    """The subcommand of every dbt invocation in ``dbt_command``, e.g. ``["deps", "run"]``."""
+    subcommands = []
+    for part in COMMAND_SEPARATOR_RE.split(dbt_command):
+        try:
+            words = shlex.split(part)
+        except ValueError:
+            continue
+        if not words or words[0] != "dbt":
+            continue
+        # global flags such as --debug may come before the subcommand
+        subcommand = next((word for word in words[1:] if not word.startswith("-")), None)
+        if subcommand is not None:
+            subcommands.append(subcommand)
+    return subcommands
+
+
+def write_state_manifest(manifest_json, state_dir):
+    """Write the manifest of an earlier run where ``--state`` can read it."""
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, "manifest.json"), "w", encoding="utf-8") as manifest:
+        manifest.write(manifest_json)
+
+
+def add_state_args(dbt_command, state_dir, select_modified=False, defer=False):
+    """Point every dbt invocation in ``dbt_command`` at the manifest in ``state_dir``.
+
+    With ``select_modified`` only what changed since that manifest is run
+    (``state:modified+``), unless the invocation selects nodes itself. With
+    ``defer`` unselected upstream nodes resolve to the relations of that run.
+    """
+    parts = COMMAND_SEPARATOR_RE.split(dbt_command)
+    for index, part in enumerate(parts):
+        try:
+            words = shlex.split(part)
+        except ValueError:
+            continue
+        if len(words) < 2 or words[0] != "dbt" or words[1] not in STATE_SUBCOMMANDS:
+            continue
+        if "--state" in words:
+            continue
+        extra = ["--state", shlex.quote(state_dir)]
+        if select_modified and not any(
+            word.split("=")[0] in SELECT_FLAGS for word in words
+        ):
+            extra += ["--select", "state:modified+"]
+        if defer and "--defer" not in words:
+            extra.append("--defer")
+        parts[index] = " ".join([part.rstrip()] + extra)
+    return "".join(parts)
@@ -0,0 +1,101 @@
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+
+from dbt.utils.common import save_profile_yml
+from dbt.utils.git import (
+    add_worktree,
+    mirror_lock,
+    mirror_path,
+    remove_worktree,
+    repo_path,
+    resolve_commit,
+    sync_mirror,
+)
+
+# directories dbt deps installs packages into, carried over between runs
+PACKAGES_DIRS = ("dbt_packages", "dbt_modules")
+
+
+class RunWorkspace:
+    """A private checkout of one repo commit, with its own profiles and target dir.
+
+    Every run gets its own worktree of the repo's mirror, so tasks pointing at
+    the same repo can run at the same time without sharing ``target/``.
+    """
+
+    def __init__(self, git_repo, name=None):
+        self.git_repo = git_repo
+        self.name = name or "{}-{}-{}".format(
+            getattr(settings, "EXTERNAL_REPO_PREFIX"), git_repo.id, uuid.uuid4().hex[:12]
+        )
+        self.path = os.path.join(getattr(settings, "GIT_RUNS_PATH"), self.name)
+        self.profiles_dir = os.path.join(self.path, ".dbt_profiles")
+        self.target_dir = os.path.join(self.path, "target")
+        self.commit = None
+
+    def fetch(self, commit=None):
+        """Update the mirror and resolve ``commit`` (default: remote HEAD) into
+        ``self.commit`` without checking anything out; returns (bool, msg)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with mirror_lock(self.git_repo.id):
+            result, msg = sync_mirror(self.git_repo)
+            if not result:
+                if not os.path.isdir(mirror_path(self.git_repo.id)):
+                    return result, msg
+                # keep going with what was fetched last time
+                print(f"Fetching {self.git_repo} failed, using the mirror as is: {msg}")
+            self.commit = resolve_commit(self.git_repo, commit or "HEAD")
+        if self.commit is None:
+            return False, f"fatal: could not resolve {commit or 'HEAD'}"
+        return True, ""
+
+    def checkout(self, profile_yml_content):
+        """Check the fetched commit out with its profiles.yml and packages; returns (bool, msg)."""
+        with mirror_lock(self.git_repo.id):
+            result, msg = add_worktree(self.git_repo, self.path, self.commit)
+        if not result:
+            return result, msg
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        save_profile_yml(profile_yml_content, os.path.join(self.profiles_dir, "profiles.yml"))
+        self.copy_packages(repo_path(self.git_repo.id), self.path)
+        return True, ""
+
+    def env(self):
+        return dict(os.environ, DBT_PROFILES_DIR=self.profiles_dir)
+
+    def copy_packages(self, source, destination):
+        for packages_dir in PACKAGES_DIRS:
+            source_dir = os.path.join(source, packages_dir)
+            if os.path.isdir(source_dir) and not os.path.exists(
+                os.path.join(destination, packages_dir)
+            ):
+                shutil.copytree(source_dir, os.path.join(destination, packages_dir), symlinks=True)
+
+    def save_packages(self):
+        """Keep packages installed by this run for the runs that follow."""
+        shared_path = repo_path(self.git_repo.id)
+        for packages_dir in PACKAGES_DIRS:
+            source_dir = os.path.join(self.path, packages_dir)
+            if not os.path.isdir(source_dir) or not os.path.isdir(shared_path):
+                continue
+            shared_dir = os.path.join(shared_path, packages_dir)
+            staging_dir = f"{shared_dir}.{self.name}"
+            shutil.copytree(source_dir, staging_dir, symlinks=True)
+            try:
+                if os.path.isdir(shared_dir):
+                    shutil.rmtree(shared_dir)
+                os.rename(staging_dir, shared_dir)
+            except OSError as err:
+                # another run is saving its packages at the same time
+                print(f"Could not save {packages_dir}: {err}")
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def remove(self):
+        if not os.path.exists(self.path):
+            # fetched only, nothing was checked out
+            return
+        with mirror_lock(self.git_repo.id):
+            remove_worktree(self.git_repo, self.path)